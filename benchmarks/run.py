@@ -0,0 +1,294 @@
+"""
+End-to-end benchmarks for paragres.
+
+Generates synthetic source databases of different shapes on a local PostgreSQL server, times
+each sync mode and appends the results to a JSON lines file, so runs of different paragres
+versions can be compared:
+
+    python benchmarks/run.py run --scale 1 --repeat 3
+    python benchmarks/run.py compare
+
+Connection parameters are taken from the usual PG* environment variables, or --host, --port,
+--user and --password. The user must be able to create databases.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+try:
+    # Python 3
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paragres import api  # NOQA: E402
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+
+# SQL to build each shape; {scale} is an integer multiplier for the amount of data
+SHAPES = {
+    'many_small_tables': """
+        DO $$
+        BEGIN
+            FOR i IN 1..500 * {scale} LOOP
+                EXECUTE format('CREATE TABLE small_%s (id serial PRIMARY KEY, name text, '
+                               'created timestamptz DEFAULT now())', i);
+                EXECUTE format('INSERT INTO small_%s (name) SELECT md5(g::text) '
+                               'FROM generate_series(1, 100) g', i);
+            END LOOP;
+        END $$;
+    """,
+    'huge_table': """
+        CREATE TABLE huge (id bigserial PRIMARY KEY, account integer, amount numeric,
+                           note text, created timestamptz);
+        INSERT INTO huge (account, amount, note, created)
+            SELECT g % 1000, g * 1.5, md5(g::text), now() - g * interval '1 second'
+            FROM generate_series(1, 2000000 * {scale}) g;
+    """,
+    'wide_rows': """
+        DO $$
+        BEGIN
+            EXECUTE 'CREATE TABLE wide (id serial PRIMARY KEY, '
+                || (SELECT string_agg(format('c%s text', c), ', ')
+                    FROM generate_series(1, 50) c) || ')';
+            EXECUTE 'INSERT INTO wide ('
+                || (SELECT string_agg(format('c%s', c), ', ') FROM generate_series(1, 50) c)
+                || ') SELECT '
+                || (SELECT string_agg('repeat(md5(g::text), 4)', ', ')
+                    FROM generate_series(1, 50) c)
+                || format(' FROM generate_series(1, %s) g', 50000 * {scale});
+        END $$;
+    """,
+    'heavy_indexes': """
+        CREATE TABLE indexed (id serial PRIMARY KEY, a integer, b integer, c text, d text,
+                              e timestamptz, f numeric);
+        INSERT INTO indexed (a, b, c, d, e, f)
+            SELECT g % 997, g % 101, md5(g::text), md5((g * 7)::text),
+                   now() - g * interval '1 minute', g / 3.0
+            FROM generate_series(1, 500000 * {scale}) g;
+        CREATE INDEX ON indexed (a);
+        CREATE INDEX ON indexed (b);
+        CREATE INDEX ON indexed (c);
+        CREATE INDEX ON indexed (d);
+        CREATE INDEX ON indexed (e);
+        CREATE INDEX ON indexed (f);
+        CREATE INDEX ON indexed (a, b);
+        CREATE INDEX ON indexed (b, e);
+        CREATE INDEX ON indexed (lower(c));
+        CREATE INDEX ON indexed (d text_pattern_ops);
+    """,
+    'large_objects': """
+        CREATE TABLE documents (id serial PRIMARY KEY, content oid);
+        INSERT INTO documents (content)
+            SELECT lo_from_bytea(0, convert_to(repeat(md5(g::text), 32768), 'UTF8'))
+            FROM generate_series(1, 100 * {scale}) g;
+    """,
+}
+
+MODES = ['file', 'url', 'db']
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def get_version():
+    """ paragres version and, if available, the git commit being benchmarked. """
+    try:
+        import pkg_resources
+        version = pkg_resources.require('paragres')[0].version
+    except Exception:
+        version = 'unknown'
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        version = '%s+%s' % (version, commit.strip().decode('ascii'))
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return version
+
+
+class Benchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.settings = {}
+        for key in ['host', 'port', 'user', 'password']:
+            if getattr(args, key):
+                self.settings[key.upper()] = getattr(args, key)
+        self.work_dir = tempfile.mkdtemp(prefix='paragres-benchmark-')
+
+    def get_settings(self, dbname):
+        settings = dict(self.settings)
+        settings['NAME'] = dbname
+        return settings
+
+    def get_env(self):
+        env = dict(os.environ)
+        if self.args.password:
+            env['PGPASSWORD'] = self.args.password
+        return env
+
+    def get_connection_args(self):
+        return ['--%s=%s' % (key.lower(), value) for key, value in self.settings.items()
+                if key != 'PASSWORD']
+
+    def create_source(self, shape):
+        """ Create the synthetic source database for a shape, and dump it to a file. """
+        dbname = 'paragres_bench_%s' % shape
+        print("Generating '%s' (scale %s)" % (dbname, self.args.scale))
+        connection_args = self.get_connection_args()
+        subprocess.check_call(['dropdb', '--if-exists', dbname] + connection_args,
+                              env=self.get_env())
+        subprocess.check_call(['createdb', dbname] + connection_args, env=self.get_env())
+        sql = SHAPES[shape].format(scale=self.args.scale)
+        subprocess.check_call(['psql', '--quiet', '--no-psqlrc', '--set=ON_ERROR_STOP=1',
+                               '--dbname=%s' % dbname, '--command=%s' % sql] + connection_args,
+                              env=self.get_env())
+        subprocess.check_call(['psql', '--quiet', '--no-psqlrc', '--dbname=%s' % dbname,
+                               '--command=VACUUM ANALYZE'] + connection_args, env=self.get_env())
+        dump_file = os.path.join(self.work_dir, '%s.dump' % dbname)
+        subprocess.check_call(['pg_dump', '-Fc', '--no-acl', '--no-owner', '--dbname=%s' % dbname,
+                               '--file=%s' % dump_file] + connection_args, env=self.get_env())
+        return dbname, dump_file
+
+    def serve(self):
+        """ Serve the work directory over HTTP from a background thread. """
+        os.chdir(self.work_dir)
+        server = HTTPServer(('127.0.0.1', 0), QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def time_sync(self, source, destination_name):
+        report_file = os.path.join(self.work_dir, 'profile.json')
+        destination = api.Destination(settings=self.get_settings(destination_name))
+        start = time.time()
+        api.sync(source, destination, jobs=self.args.jobs, profile=report_file,
+                 verbosity=self.args.verbosity)
+        duration = time.time() - start
+        with open(report_file) as report:
+            totals = json.load(report)['process_totals']
+        return duration, totals
+
+    def run(self):
+        original_dir = os.getcwd()
+        server = self.serve()
+        url_base = 'http://127.0.0.1:%s/' % server.server_address[1]
+        results = []
+        try:
+            for shape in self.args.shapes:
+                dbname, dump_file = self.create_source(shape)
+                sources = {
+                    'file': api.Source(file=dump_file),
+                    'url': api.Source(url=url_base + os.path.basename(dump_file)),
+                    'db': api.Source(settings=self.get_settings(dbname)),
+                }
+                for mode in self.args.modes:
+                    durations = []
+                    process_totals = []
+                    for iteration in range(self.args.repeat):
+                        duration, totals = self.time_sync(sources[mode],
+                                                          'paragres_bench_destination')
+                        print("%s %s run %s: %.2fs" % (shape, mode, iteration + 1, duration))
+                        durations.append(duration)
+                        process_totals.append(totals)
+                    results.append({
+                        'version': self.args.label or get_version(),
+                        'timestamp': time.time(),
+                        'host': socket.gethostname(),
+                        'shape': shape,
+                        'mode': mode,
+                        'scale': self.args.scale,
+                        'jobs': self.args.jobs,
+                        'source_bytes': os.path.getsize(dump_file),
+                        'durations': durations,
+                        'median': sorted(durations)[len(durations) // 2],
+                        'process_totals': process_totals,
+                    })
+        finally:
+            server.shutdown()
+            os.chdir(original_dir)
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+        with open(self.args.results, 'a') as output:
+            for result in results:
+                output.write('%s\n' % json.dumps(result, sort_keys=True))
+        print("Results appended to '%s'" % self.args.results)
+
+
+def compare(args):
+    """ Print the median time of each shape and mode for each benchmarked version. """
+    medians = {}
+    versions = []
+    with open(args.results) as results:
+        for line in results:
+            result = json.loads(line)
+            if result['scale'] != args.scale:
+                continue
+            if result['version'] not in versions:
+                versions.append(result['version'])
+            # The latest result for a version wins
+            medians[(result['shape'], result['mode'], result['version'])] = result['median']
+    versions = versions[-args.last:]
+    print('%-30s' % 'shape/mode' + ''.join('%20s' % version[:19] for version in versions))
+    for shape in sorted(SHAPES):
+        for mode in MODES:
+            row = [medians.get((shape, mode, version)) for version in versions]
+            if any(value is not None for value in row):
+                print('%-30s' % ('%s/%s' % (shape, mode)) +
+                      ''.join('%20s' % ('-' if value is None else '%.2fs' % value)
+                              for value in row))
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Benchmark paragres sync modes.')
+    subparsers = parser.add_subparsers(dest='action')
+
+    run_parser = subparsers.add_parser('run', help='Generate databases and time syncs')
+    run_parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    run_parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    run_parser.add_argument('--scale', type=int, default=1,
+                            help='Multiplier for the amount of generated data')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per shape and mode')
+    run_parser.add_argument('--jobs', type=int, help='Parallel pg_restore jobs')
+    run_parser.add_argument('--label', help='Version label (default: package version and commit)')
+    run_parser.add_argument('--host')
+    run_parser.add_argument('--port')
+    run_parser.add_argument('--user')
+    run_parser.add_argument('--password')
+    run_parser.add_argument('--verbosity', type=int, default=0)
+    run_parser.add_argument('--results', default=DEFAULT_RESULTS)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare stored results')
+    compare_parser.add_argument('--scale', type=int, default=1)
+    compare_parser.add_argument('--last', type=int, default=5,
+                                help='Number of most recent versions to show')
+    compare_parser.add_argument('--results', default=DEFAULT_RESULTS)
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    if args.action == 'run':
+        Benchmark(args).run()
+    elif args.action == 'compare':
+        compare(args)
+    else:
+        create_parser().print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+try:
+    # Python 2; io.StringIO also exists there, but only accepts unicode
+    from StringIO import StringIO
+except ImportError:
+    # Python 3
+    from io import StringIO
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    # Without a driver, paragres uses the PostgreSQL client tools (dropdb, createdb, psql)
+    psycopg2 = None
+
+# Database to connect to for statements about other databases, as dropdb and createdb do
+MAINTENANCE_DB = 'postgres'
+
+
+def quote_identifier(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def quote_literal(value):
+    return "'%s'" % value.replace("'", "''")
+
+
+class AdminSessionError(Exception):
+    """ A statement failed on an admin session. """
+
+
+class AdminSession(object):
+    """ An autocommit driver connection to one database, used instead of starting a client
+    tool, and so a new connection, for each statement. """
+
+    def __init__(self, connection, dbname, password=None):
+        params = dict(connection)
+        params['dbname'] = dbname
+        if password:
+            params['password'] = password
+        self.connection = psycopg2.connect(**params)
+        self.connection.autocommit = True
+
+    def execute(self, sql):
+        """ Run sql and return its rows in psql's unaligned format, with values as the server
+        sent them as text, e.g. 't' rather than True. """
+        cursor = self.connection.cursor()
+        try:
+            if sql.lstrip().upper().startswith('COPY '):
+                output = StringIO()
+                cursor.copy_expert(sql, output)
+                return output.getvalue()
+            cursor.execute(sql)
+            if cursor.description is None:
+                return ''
+            type_codes = tuple(set(column[1] for column in cursor.description))
+            as_text = psycopg2.extensions.new_type(type_codes, 'PARAGRES_TEXT',
+                                                   lambda value, cursor: value)
+            psycopg2.extensions.register_type(as_text, cursor)
+            rows = cursor.fetchall()
+        except psycopg2.Error as e:
+            raise AdminSessionError(str(e).strip())
+        finally:
+            cursor.close()
+        return '\n'.join('|'.join('' if value is None else value for value in row)
+                         for row in rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class SessionPool(object):
+    """ At most one admin session per server, user and database for a run. A server which
+    cannot be connected to with the driver is remembered, so the client tools are used for
+    it instead. """
+
+    def __init__(self, print_message=None):
+        self.print_message = print_message or (lambda message: None)
+        self.sessions = {}
+
+    def get(self, connection, dbname, password=None):
+        """ Session for the database, or None if the client tools should be used. """
+        if psycopg2 is None:
+            return None
+        key = (connection.get('host'), connection.get('port'), connection.get('user'), dbname)
+        if key not in self.sessions:
+            try:
+                self.sessions[key] = AdminSession(connection, dbname, password=password)
+            except psycopg2.Error as e:
+                self.print_message("Could not open an admin session for database '%s' (%s), "
+                                   "using client tools" % (dbname, str(e).strip()))
+                self.sessions[key] = None
+        return self.sessions[key]
+
+    def close(self):
+        for session in self.sessions.values():
+            if session:
+                session.close()
+        self.sessions = {}
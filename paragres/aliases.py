@@ -0,0 +1,106 @@
+import copy
+import os
+import sys
+import threading
+import time
+
+from paragres.command import Command
+from paragres.history import format_duration
+
+
+def get_alias_settings(command, aliases=None):
+    """ Pair the source and destination settings of each alias. Without aliases, every alias
+    present in both settings files is used, in name order. """
+    source = command.read_database_settings(command.args.source_settings) or {}
+    destination = command.read_database_settings(command.args.settings) or {}
+    if not aliases:
+        aliases = sorted(alias for alias in source if alias in destination)
+        if not aliases:
+            command.error('The source and destination settings have no database aliases in '
+                          'common')
+    for alias in aliases:
+        if alias not in source or alias not in destination:
+            command.error("Database alias '%s' must be in both the source and destination "
+                          "settings" % alias)
+    return [(alias, source[alias], destination[alias]) for alias in aliases]
+
+
+class AliasSync(object):
+    """ Copies several databases of a Django project at once, each source DATABASES alias
+    to the same alias in the destination settings, with at most concurrency running at a
+    time. Failures of one alias do not stop the others. The ready file and command are used
+    once, when every alias has been copied. """
+
+    def __init__(self, args, create_command=Command):
+        self.args = args
+        self.create_command = create_command
+        self.results = []
+        self.lock = threading.Lock()
+
+    def create_alias_command(self, alias, source_settings, destination_settings):
+        args = copy.copy(self.args)
+        args.source_settings = source_settings
+        args.settings = destination_settings
+        args.aliases = None
+        args.ready_file = None
+        args.ready_command = None
+        # Dumps are named after the database, which aliases on different hosts can share
+        args.work_dir = os.path.join(self.args.work_dir or os.curdir, alias)
+        if not os.path.isdir(args.work_dir):
+            os.makedirs(args.work_dir)
+        command = self.create_command(args)
+        command.message_prefix = '[%s] ' % alias
+        return command
+
+    def sync_alias(self, alias, command):
+        started_at = time.time()
+        error = None
+        try:
+            command.run()
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        with self.lock:
+            self.results.append({
+                'alias': alias,
+                'succeeded': error is None,
+                'duration': time.time() - started_at,
+                'error': error,
+            })
+
+    def worker(self, pending):
+        while True:
+            with self.lock:
+                if not pending:
+                    return
+                alias, command = pending.pop(0)
+            self.sync_alias(alias, command)
+
+    def run(self):
+        """ Sync every alias and return a result for each, in alias order. """
+        command = self.create_command(self.args)
+        alias_settings = get_alias_settings(command, self.args.aliases)
+        pending = [(alias, self.create_alias_command(alias, source, destination))
+                   for alias, source, destination in alias_settings]
+        order = [alias for alias, _ in pending]
+        concurrency = min(self.args.alias_concurrency or len(pending), len(pending))
+        self.results = []
+        threads = [threading.Thread(target=self.worker, args=(pending,))
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if all(result['succeeded'] for result in self.results):
+            command.signal_ready()
+        return sorted(self.results, key=lambda result: order.index(result['alias']))
+
+    def print_report(self, results, output=None):
+        output = output or sys.stdout
+        output.write('\n%-20s %-8s %10s\n' % ('Alias', 'Result', 'Duration'))
+        for result in results:
+            output.write('%-20s %-8s %10s\n' % (result['alias'],
+                                                'ok' if result['succeeded'] else 'FAILED',
+                                                format_duration(result['duration'])))
+        for result in results:
+            if not result['succeeded']:
+                output.write("%s: %s\n" % (result['alias'], result['error']))
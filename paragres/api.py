@@ -0,0 +1,117 @@
+import functools
+import shutil
+import tempfile
+
+from paragres.cli import create_parser, verify_args
+from paragres.command import Command, CommandError
+
+
+class Source(object):
+    """ Location to copy a database from. Exactly one of file, url, heroku_app, dbname or
+    settings is required. settings may be a settings file path or a Django-style database
+    settings dictionary, and dbname overrides its NAME if both are given. """
+
+    def __init__(self, file=None, url=None, heroku_app=None, dbname=None, settings=None,
+                 capture=False, max_backup_age=None):
+        self.file = file
+        self.url = url
+        self.heroku_app = heroku_app
+        self.dbname = dbname
+        self.settings = settings
+        self.capture = capture
+        self.max_backup_age = max_backup_age
+
+    def apply(self, args):
+        args.file = self.file
+        args.url = self.url
+        args.source_app = self.heroku_app
+        args.source_dbname = self.dbname
+        args.source_settings = self.settings
+        args.capture = self.capture
+        args.max_backup_age = self.max_backup_age
+
+
+class Destination(object):
+    """ Location to replace with the source's data: a Heroku app, or a postgres database named
+    by dbname and/or settings (a settings file path or database settings dictionary). """
+
+    def __init__(self, dbname=None, settings=None, heroku_app=None):
+        self.dbname = dbname
+        self.settings = settings
+        self.heroku_app = heroku_app
+
+    def apply(self, args):
+        args.dbname = self.dbname
+        args.settings = self.settings
+        args.destination_app = self.heroku_app
+
+
+def create_command(source, destination, **options):
+    """ Build a Command for copying source to destination. options are the long command line
+    option names, e.g. jobs=4 or verbosity=0. """
+    args = create_parser().parse_args([])
+    args.verbosity = 0
+    for name, value in options.items():
+        if not hasattr(args, name):
+            raise TypeError("Unknown option '%s'" % name)
+        setattr(args, name, value)
+    source.apply(args)
+    destination.apply(args)
+    error_message = verify_args(args)
+    if error_message:
+        raise CommandError(error_message)
+    return Command(args)
+
+
+def fetch_source(source, work_dir, **options):
+    """ Capture, download or dump source into a local dump file in work_dir and return its
+    path, so it can be restored several times. A file source is used where it is, or unzipped
+    into work_dir if zipped; the source file itself is never changed. """
+    options = dict(options, work_dir=work_dir)
+    command = create_command(source, Destination(dbname='paragres'), **options)
+    args = command.args
+    if args.source_settings:
+        settings = command.parse_db_settings(args.source_settings)
+        command.initialize_db_args(settings, 'source')
+    if args.capture:
+        command.capture_heroku_database()
+    if args.source_app:
+        filename = command.download_file_from_url(
+            args.source_app, command.get_file_url_for_heroku_app(args.source_app))
+    elif args.url:
+        filename = command.download_file_from_url(None, args.url)
+    elif args.file:
+        return command.unzip_file_copy_if_necessary(args.file)
+    else:
+        filename = command.dump_database()
+    return command.unzip_file_if_necessary(filename)
+
+
+def sync(source, destination, **options):
+    """ Replace destination with the data from source. Unlike the command line, this never
+    exits the process: failures raise CommandError or subprocess.CalledProcessError. It is
+    safe to run several syncs concurrently in one process. Unless a work_dir option is given,
+    intermediate files are kept in a temporary directory which is removed afterwards. """
+    work_dir = None
+    if not options.get('work_dir'):
+        work_dir = tempfile.mkdtemp(prefix='paragres-')
+        options['work_dir'] = work_dir
+    try:
+        create_command(source, destination, **options).run()
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def sync_async(source, destination, executor=None, **options):
+    """ Awaitable version of sync, run in executor (default: the event loop's default
+    executor) on the running event loop, or the current one when called outside a coroutine.
+    Python 3 only. """
+    import asyncio
+    try:
+        loop = asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        # Python before 3.7, or no loop is running
+        loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor,
+                                functools.partial(sync, source, destination, **options))
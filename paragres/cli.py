@@ -1,7 +1,13 @@
 import argparse
+import os
 import pkg_resources
+import sys
 
-from paragres.command import Command
+from paragres.aliases import AliasSync
+from paragres.command import TRANSPORT_COMPRESSION, Command, CommandError
+from paragres.compression import parse_setting
+from paragres.history import DEFAULT_HISTORY_FILE
+from paragres.watch import Watcher
 
 
 def create_parser():
@@ -9,8 +15,7 @@ def create_parser():
         description='Copy a PostgreSQL database from one location to another.\n\n'
                     'Any Heroku apps must have the Heroku Postgres and PG Backups add-ons.\n'
                     'Specify a Heroku app destination with -d or omit to use postgres directly.\n\n'
-                    'A single source is required, one of (-u, -s, -b, -o) for a Heroku destination'
-                    '\nor one of (-f, -u, -s, -b, -o) for a postgres destination.\n'
+                    'A single source is required, one of (-f, -u, -s, -b, -o).\n'
                     'You may specify that a new Heroku backup be captured (-c), otherwise the '
                     'most recent backup will be used.\n\n'
                     'A postgres source requires either a settings file (-o) or a database '
@@ -27,6 +32,9 @@ def create_parser():
     parser.add_argument('-s', '--source-app', type=str, help='Heroku app from which to pull db')
     parser.add_argument('-c', '--capture', default=False, action='store_true',
                         help='Capture a new Heroku backup')
+    parser.add_argument('--max-backup-age', type=int, metavar='MINUTES',
+                        help='With -c, only capture if the most recent completed backup is older '
+                             'than this many minutes')
     parser.add_argument('-o', '--source-settings', type=str,
                         help="Django-style settings file with database connection information for "
                              "source database\n(or 'DJANGO_SETTINGS_MODULE' to use that "
@@ -34,6 +42,25 @@ def create_parser():
     parser.add_argument('-b', '--source-dbname', type=str,
                         help='Source database name (overrides value in source settings if both are '
                              'specified)')
+    parser.add_argument('--compression', type=str, metavar='SETTING',
+                        help='pg_dump compression for a source database (-b or -o): none, gzip, '
+                             'lz4 or zstd,\noptionally with a level (e.g. zstd:3), or auto to '
+                             'pick the fastest from a sample\n(lz4 and zstd need pg_dump 16 or '
+                             'later)')
+    parser.add_argument('--ssh', type=str, metavar='[USER@]HOST',
+                        help='Run pg_dump for the source database (-b or -o) on this host over '
+                             'SSH')
+    parser.add_argument('--ssh-compression', choices=sorted(TRANSPORT_COMPRESSION),
+                        help='Compression for the dump streamed over SSH: lz4 for fast links, '
+                             'zstd for most\nlinks, none if the link is faster than compression '
+                             '(default: gzip)')
+    parser.add_argument('--aliases', nargs='*', metavar='ALIAS',
+                        help='Copy these DATABASES aliases from the source settings (-o) to the '
+                             'same aliases in the\ndestination settings (-t), or every alias in '
+                             'both if none are given')
+    parser.add_argument('--alias-concurrency', type=int, metavar='N',
+                        help='With --aliases, copy at most this many databases at once '
+                             '(default: all)')
     parser.add_argument('-d', '--destination-app', type=str,
                         help='Heroku app for which to replace db')
     parser.add_argument('-t', '--settings', type=str,
@@ -43,8 +70,63 @@ def create_parser():
     parser.add_argument('-n', '--dbname', type=str,
                         help='Destination database name (overrides value in settings if both are '
                              'specified)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of parallel pg_restore jobs (defaults to the number of CPUs '
+                             'when restoring a\nfile or database to a Heroku app)')
+    parser.add_argument('--unlogged', choices=['keep', 'set-logged'],
+                        help='Restore tables as UNLOGGED to skip writing WAL while loading data, '
+                             'then keep them\nunlogged (for disposable databases) or set them '
+                             'logged (postgres destination only)')
+    parser.add_argument('--critical-path-report', action='store_true', default=False,
+                        help='Report the predicted longest restore job and its tables, using '
+                             'sizes from the\nsource database; pg_dump and pg_restore already '
+                             'start the largest items first\n(postgres source and destination '
+                             'only)')
+    parser.add_argument('--hot-tables', nargs='+', metavar='TABLE',
+                        help='Restore these tables with their indexes and constraints first, '
+                             'signal that the\ndatabase is ready, then load the remaining tables '
+                             '(postgres destination only)')
+    parser.add_argument('--ready-file', type=str, metavar='FILE',
+                        help='Write the time to this file once the database is ready for use')
+    parser.add_argument('--ready-command', type=str, metavar='COMMAND',
+                        help='Run this shell command once the database is ready for use')
+    parser.add_argument('--terminate-connections', action='store_true', default=False,
+                        help='Disconnect other sessions from the destination database before '
+                             'dropping it')
+    parser.add_argument('--no-admin-session', action='store_true', default=False,
+                        help='Use dropdb, createdb and psql even if the psycopg2 driver is '
+                             'installed')
+    parser.add_argument('--work-dir', type=str, metavar='DIR',
+                        help='Directory for downloaded and dumped files (default: current '
+                             'directory)')
     parser.add_argument('-v', '--verbosity', type=int, default=1,
                         help='Verbosity level: 0=minimal output, 1=normal output')
+    parser.add_argument('--watch', type=int, metavar='SECONDS',
+                        help='Keep running, checking the Heroku app (-s) or url (-u) source this '
+                             'often and syncing\nwhenever a new backup appears')
+    parser.add_argument('--watch-status', type=str, metavar='FILE',
+                        help='With --watch, write health and last sync metrics to this JSON file')
+    parser.add_argument('--replicate', action='store_true', default=False,
+                        help='Copy the source schema to the destination and keep its data current '
+                             'with logical\nreplication (postgres source and destination only)')
+    parser.add_argument('--replication-lag', action='store_true', default=False,
+                        help='Show how far the destination is behind the source')
+    parser.add_argument('--stop-replication', action='store_true', default=False,
+                        help='Remove the subscription from the destination and the publication '
+                             'from the source')
+    parser.add_argument('--profile', type=str, metavar='FILE',
+                        help='Write wall time, CPU time, peak memory and block I/O of each child '
+                             'process to\nthis JSON report')
+    parser.add_argument('--profile-python', action='store_true', default=False,
+                        help="With --profile, also profile paragres' own Python code")
+    parser.add_argument('--plan', action='store_true', default=False,
+                        help='Estimate the time and scratch disk space needed from previous runs, '
+                             'check there\nis enough free space, and exit without copying')
+    parser.add_argument('--history', type=str, metavar='FILE',
+                        help='Run history used by --plan and to flag slow runs (default: %s)'
+                             % DEFAULT_HISTORY_FILE.replace(os.path.expanduser('~'), '~'))
+    parser.add_argument('--no-history', action='store_true', default=False,
+                        help='Do not record this run in the history')
     # The pgbackups addon is deprecated, but continue supporting it until it is removed
     parser.add_argument('--use-pgbackups', action='store_true', default=False,
                         help="Use the deprecated pgbackups addon rather than Heroku pg:backups")
@@ -56,12 +138,94 @@ def verify_args(args):
     if args.capture and not args.source_app:
         return 'Heroku backup capture requires a source Heroku app (-s)'
 
+    if args.max_backup_age is not None and not args.capture:
+        return 'A maximum backup age (--max-backup-age) requires backup capture (-c)'
+
+    if args.jobs is not None and args.jobs < 1:
+        return 'Number of jobs (-j) must be at least 1'
+
+    if args.watch is not None:
+        if args.watch < 1:
+            return 'Watch interval (--watch) must be at least 1 second'
+        if not args.source_app and not args.url:
+            return 'Watch mode (--watch) requires a Heroku app (-s) or url (-u) source'
+        if args.capture:
+            return 'Watch mode (--watch) cannot be combined with backup capture (-c)'
+    elif args.watch_status:
+        return 'A watch status file (--watch-status) requires watch mode (--watch)'
+
+    if args.profile_python and not args.profile:
+        return 'Python profiling (--profile-python) requires a report file (--profile)'
+
+    if args.plan and args.watch is not None:
+        return 'Planning (--plan) cannot be combined with watch mode (--watch)'
+
+    if args.unlogged and args.destination_app:
+        return 'Unlogged restores (--unlogged) require a postgres destination'
+
+    if args.aliases is not None:
+        other_options = (args.source_dbname or args.dbname or args.destination_app or args.file
+                         or args.url or args.source_app or args.watch or args.profile
+                         or args.replicate or args.replication_lag or args.stop_replication)
+        if other_options or not (args.source_settings and args.settings):
+            return ('Copying aliases (--aliases) requires source (-o) and destination (-t) '
+                    'settings files, and no other locations, watch, profile or replication '
+                    'options')
+        if args.hot_tables:
+            return ('Hot tables (--hot-tables) name tables of one database and cannot be '
+                    'combined with --aliases')
+        if args.alias_concurrency is not None and args.alias_concurrency < 1:
+            return 'Alias concurrency (--alias-concurrency) must be at least 1'
+    elif args.alias_concurrency is not None:
+        return 'Alias concurrency (--alias-concurrency) requires --aliases'
+
+    if args.compression:
+        if not parse_setting(args.compression):
+            return ('Compression (--compression) must be auto, none, gzip, lz4 or zstd, '
+                    'optionally with a level (e.g. zstd:3)')
+        if args.ssh or not (args.source_dbname or args.source_settings):
+            return ('Compression (--compression) requires a local postgres source (-b or -o); '
+                    'use --ssh-compression with --ssh')
+
+    if args.ssh:
+        if args.ssh.startswith('-'):
+            return 'An SSH source (--ssh) must be a [USER@]HOST, not an option'
+        if not (args.source_dbname or args.source_settings):
+            return 'An SSH source (--ssh) requires a source database (-b or -o)'
+        if (args.critical_path_report or args.replicate or args.replication_lag
+                or args.stop_replication):
+            return ('An SSH source (--ssh) cannot be combined with --critical-path-report or '
+                    'replication')
+    elif args.ssh_compression:
+        return 'Transport compression (--ssh-compression) requires an SSH source (--ssh)'
+
+    if args.critical_path_report and (args.destination_app
+                                      or not (args.source_dbname or args.source_settings)):
+        return ('Critical path reports (--critical-path-report) require a postgres source '
+                '(-b or -o) and destination')
+
+    if (args.hot_tables or args.ready_file or args.ready_command) and args.destination_app:
+        return ('Prioritized restores (--hot-tables, --ready-file, --ready-command) require a '
+                'postgres destination')
+
+    replication_modes = [args.replicate, args.replication_lag, args.stop_replication]
+    if any(replication_modes):
+        if sum(replication_modes) > 1:
+            return ('Only one of --replicate, --replication-lag or --stop-replication may be '
+                    'specified')
+        other_locations = (args.destination_app or args.file or args.url or args.source_app
+                           or args.capture or args.watch)
+        has_postgres_locations = ((args.source_dbname or args.source_settings)
+                                  and (args.dbname or args.settings))
+        if other_locations or not has_postgres_locations:
+            return 'Replication requires a postgres source (-b or -o) and destination (-n or -t)'
+
     if args.destination_app:
-        has_one_data_source = (bool(args.url) ^ bool(args.source_app)
+        has_one_data_source = (bool(args.file) ^ bool(args.url) ^ bool(args.source_app)
                                ^ bool(args.source_dbname) ^ bool(args.source_settings))
         if not has_one_data_source:
-            return ('A Heroku app destination requires a single source, one of url (-u), '
-                    'Heroku app (-s), db name (-b) or db settings (-o)')
+            return ('A Heroku app destination requires a single source, one of file (-f), '
+                    'url (-u), Heroku app (-s), db name (-b) or db settings (-o)')
     else:
         if not args.dbname and not args.settings and not args.capture:
             # Capturing a db does not require any destination information, so it is ok not to have
@@ -83,6 +247,17 @@ def error(parser, message):
     parser.exit(message="\nERROR: %s\n" % message)
 
 
+def sync_aliases(args):
+    alias_sync = AliasSync(args)
+    try:
+        results = alias_sync.run()
+    except CommandError as e:
+        sys.stderr.write("%s\n" % e)
+        return e.code
+    alias_sync.print_report(results)
+    return 0 if all(result['succeeded'] for result in results) else 1
+
+
 def main():
     parser = create_parser()
     parsed_args = parser.parse_args()
@@ -93,6 +268,19 @@ def main():
     error_message = verify_args(parsed_args)
     if error_message:
         error(parser, error_message)
+    if parsed_args.no_history:
+        parsed_args.history = None
+    elif not parsed_args.history:
+        parsed_args.history = DEFAULT_HISTORY_FILE
+    if parsed_args.aliases is not None:
+        return sync_aliases(parsed_args)
     command = Command(parsed_args)
-    command.run()
+    try:
+        if parsed_args.watch:
+            Watcher(command, parsed_args.watch, status_file=parsed_args.watch_status).run()
+        else:
+            command.run()
+    except CommandError as e:
+        sys.stderr.write("%s\n" % e)
+        return e.code
     return 0
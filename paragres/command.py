@@ -1,15 +1,54 @@
 import ast
+import calendar
+import contextlib
+import multiprocessing
 import os
-import sys
+import re
 import subprocess
+import tempfile
 import time
+try:
+    # Python 3
+    from shlex import quote as shell_quote
+except ImportError:
+    # Python 2
+    from pipes import quote as shell_quote
+try:
+    import fcntl
+except ImportError:
+    # Windows, concurrent captures will not be shared
+    fcntl = None
 try:
     # Python 3
     from urllib import parse as urlparse, request as urllib2
+    from urllib.parse import unquote
 except ImportError:
     # Python 2
     import urllib2
     import urlparse
+    from urllib import unquote
+
+from paragres import compression, toc
+from paragres.admin import (MAINTENANCE_DB, AdminSessionError, SessionPool, quote_identifier,
+                            quote_literal)
+from paragres.history import (RunHistory, create_run, format_bytes, format_duration,
+                              median)
+from paragres.profiling import RunProfiler
+
+# Rough size of a custom format dump relative to the database, used until one has been measured
+DUMP_SIZE_RATIO = 0.25
+# Commands to compress and decompress a dump streamed over SSH. lz4 suits fast links, zstd
+# most links, and gzip is available everywhere.
+TRANSPORT_COMPRESSION = {
+    'none': (None, None),
+    'gzip': ('gzip -c', 'gunzip -c'),
+    'lz4': ('lz4 -c', 'lz4 -d -c'),
+    'zstd': ('zstd -T0 -q -c', 'zstd -d -q -c'),
+}
+# Rows of the largest table copied to calibrate --compression auto
+COMPRESSION_SAMPLE_ROWS = 50000
+# Rough expansion when decompressing a gzipped dump, used until one has been measured
+UNZIP_RATIO = 4
 
 
 class DatabaseSettingsParser(ast.NodeVisitor):
@@ -21,6 +60,41 @@ class DatabaseSettingsParser(ast.NodeVisitor):
                 self.database_settings = ast.literal_eval(node.value)
 
 
+# e.g. b005  2019-06-04 15:00:12 +0000  Completed 2019-06-04 15:00:20 +0000  4.05MB  DATABASE
+HEROKU_BACKUP_PATTERN = re.compile(
+    r'^\s*(?P<id>[a-z]\d+)\s+\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4}\s+Completed '
+    r'(?P<finished>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4})')
+
+
+def parse_heroku_time(value):
+    """ Convert a Heroku timestamp such as '2019-06-04 15:00:20 +0000' to epoch seconds. """
+    timestamp, offset = value.rsplit(' ', 1)
+    seconds = calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
+    offset_seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    if offset[0] == '-':
+        offset_seconds = -offset_seconds
+    return seconds - offset_seconds
+
+
+def split_url_password(url):
+    """ Remove the password from a database URL, returning the URL and the password (None if
+    it has none). """
+    parsed = urlparse.urlparse(url)
+    if parsed.password is None:
+        return url, None
+    user_info, _, host = parsed.netloc.rpartition('@')
+    netloc = '%s@%s' % (user_info.split(':', 1)[0], host)
+    return urlparse.urlunparse(parsed._replace(netloc=netloc)), unquote(parsed.password)
+
+
+class CommandError(Exception):
+    """ A sync could not be completed. """
+
+    def __init__(self, message, code=1):
+        super(CommandError, self).__init__(message)
+        self.code = code
+
+
 class Command(object):
     settings_format = """
     DATABASES = {
@@ -40,27 +114,85 @@ class Command(object):
             'source': {
                 'name': self.args.source_dbname,
                 'args': [],
+                'connection': {},
                 'password': None,
             },
             'destination': {
                 'name': self.args.dbname,
                 'args': [],
+                'connection': {},
                 'password': None,
             }
         }
+        self.profiler = None
+        if self.args.profile:
+            self.profiler = RunProfiler(self.args.profile, profile_python=self.args.profile_python)
+        self.history = None
+        if self.args.history:
+            self.history = RunHistory(self.args.history)
+        self.phases = []
+        self.relation_sizes = None
+        self.message_prefix = ''
+        self.sessions = SessionPool(print_message=self.print_message)
 
     def print_message(self, message, verbosity_needed=1):
         """ Prints the message, if verbosity is high enough. """
         if self.args.verbosity >= verbosity_needed:
-            print(message)
+            print('%s%s' % (self.message_prefix, message))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Time a step of the run. The block may set the number of bytes it handled. """
+        record = {'phase': name, 'bytes': None}
+        start = time.time()
+        yield record
+        record['duration'] = time.time() - start
+        self.phases.append(record)
+
+    def get_file_size(self, filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return None
+
+    def get_child_env(self, db_key):
+        """ Environment for a child process connecting to the database, or None to inherit
+        this process' environment. Passwords are never written to os.environ, so concurrent
+        commands in one process cannot overwrite each other's credentials. """
+        if not db_key or not self.databases[db_key]['password']:
+            return None
+        self.print_message("Setting PGPASSWORD for %s database" % db_key, verbosity_needed=2)
+        env = dict(os.environ)
+        env['PGPASSWORD'] = self.databases[db_key]['password']
+        return env
+
+    def check_call(self, args, db_key=None):
+        """ Run a child process, recording its resource usage if profiling. """
+        kwargs = {}
+        env = self.get_child_env(db_key)
+        if env:
+            kwargs['env'] = env
+        if self.profiler:
+            return self.profiler.check_call(args, **kwargs)
+        return subprocess.check_call(args, **kwargs)
+
+    def check_output(self, args, db_key=None):
+        """ Run a child process and return its output, recording its resource usage if
+        profiling. """
+        kwargs = {}
+        env = self.get_child_env(db_key)
+        if env:
+            kwargs['env'] = env
+        if self.profiler:
+            return self.profiler.check_output(args, **kwargs)
+        return subprocess.check_output(args, **kwargs)
 
     def error(self, message, code=1):
-        """ Prints the error, and exits with the given code. """
-        sys.stderr.write(message)
-        sys.exit(code)
+        """ Raises a CommandError with the message and exit code. """
+        raise CommandError(message, code)
 
-    def parse_db_settings(self, settings):
-        """ Parse out database settings from filename or DJANGO_SETTINGS_MODULE. """
+    def read_database_settings(self, settings):
+        """ Parse the DATABASES dictionary from a settings file or DJANGO_SETTINGS_MODULE. """
         if settings == 'DJANGO_SETTINGS_MODULE':
             django_settings = os.environ.get('DJANGO_SETTINGS_MODULE')
             self.print_message("Getting settings file from DJANGO_SETTINGS_MODULE=%s"
@@ -74,9 +206,16 @@ class Command(object):
         with open(settings) as settings_file:
             settings_ast = ast.parse(settings_file.read())
             parser.visit(settings_ast)
+        return parser.database_settings
+
+    def parse_db_settings(self, settings, alias='default'):
+        """ Parse out the settings of one database alias from filename or
+        DJANGO_SETTINGS_MODULE. Settings which are already a dictionary are used as is. """
+        if isinstance(settings, dict):
+            return settings
 
         try:
-            return parser.database_settings['default']
+            return self.read_database_settings(settings)[alias]
         except KeyError as e:
             self.error("Missing key or value for: %s\nSettings must be of the form: %s"
                        % (e, self.settings_format))
@@ -94,48 +233,138 @@ class Command(object):
         db_member['password'] = settings.get('PASSWORD')
 
         args = []
+        connection = {}
         for key in ['USER', 'HOST', 'PORT']:
             value = settings.get(key)
             if value:
                 self.print_message("Adding parameter %s" % key.lower, verbosity_needed=2)
                 args.append('--%s=%s' % (key.lower(), value))
+                connection[key.lower()] = value
 
         db_member['args'] = args
+        db_member['connection'] = connection
+
+    def get_admin_session(self, db_key, dbname=None):
+        """ Pooled driver connection to the database (by default the db_key database itself)
+        on the db_key server, or None to use the client tools. """
+        if self.args.no_admin_session:
+            return None
+        return self.sessions.get(self.databases[db_key]['connection'],
+                                 dbname or self.databases[db_key]['name'],
+                                 password=self.databases[db_key]['password'])
+
+    def query_database(self, db_key, sql, dbname=None):
+        """ Run a single SQL statement, over an admin session if possible or else with psql,
+        and return its unaligned output. dbname overrides the database connected to. """
+        self.print_message("Running '%s' on %s database" % (sql, db_key), verbosity_needed=2)
+        if db_key == 'source' and self.args.ssh:
+            return self.query_database_over_ssh(sql, dbname=dbname)
+        session = self.get_admin_session(db_key, dbname=dbname)
+        if session:
+            try:
+                return session.execute(sql).strip()
+            except AdminSessionError as e:
+                self.error("Query failed on %s database: %s" % (db_key, e))
+        args = self.get_psql_args(db_key, sql, dbname=dbname)
+        return self.check_output(args, db_key=db_key).decode('utf-8').strip()
+
+    def query_database_over_ssh(self, sql, dbname=None):
+        """ Run a single SQL statement with psql on the SSH host, which can reach the source
+        database, and return its unaligned output. """
+        args = self.get_psql_args('source', sql, dbname=dbname)
+        remote_command = ' '.join(shell_quote(arg) for arg in args)
+        output = self.check_output(["ssh", "--", self.args.ssh, remote_command])
+        return output.decode('utf-8').strip()
+
+    def get_psql_args(self, db_key, sql, dbname=None):
+        args = [
+            "psql",
+            "--no-psqlrc",
+            "--tuples-only",
+            "--no-align",
+            "--set=ON_ERROR_STOP=1",
+            "--dbname=%s" % (dbname or self.databases[db_key]['name']),
+            "--command=%s" % sql,
+        ]
+        args.extend(self.databases[db_key]['args'])
+        return args
 
-    def export_pgpassword(self, db_key):
+    def get_conninfo(self, db_key):
+        """ Build a libpq connection string for the database. """
+        params = [('dbname', self.databases[db_key]['name'])]
+        connection = self.databases[db_key]['connection']
+        for key in ['host', 'port', 'user']:
+            if connection.get(key):
+                params.append((key, connection[key]))
         if self.databases[db_key]['password']:
-            self.print_message("Exporting PGPASSWORD", verbosity_needed=2)
-            os.environ['PGPASSWORD'] = self.databases[db_key]['password']
+            params.append(('password', self.databases[db_key]['password']))
+        return ' '.join("%s='%s'" % (key, str(value).replace('\\', '\\\\').replace("'", "\\'"))
+                        for key, value in params)
+
+    def get_replication_name(self):
+        """ Name of the publication and subscription used to replicate to the destination. """
+        return 'paragres_%s' % re.sub(r'\W', '_', self.databases['destination']['name'].lower())
+
+    def is_same_cluster(self):
+        """ Whether the source and destination databases are on the same server. """
+        def get_server(db_key):
+            connection = self.databases[db_key]['connection']
+            host = connection.get('host') or 'localhost'
+            if host == '127.0.0.1':
+                host = 'localhost'
+            return host, str(connection.get('port') or 5432)
+        return get_server('source') == get_server('destination')
 
     def create_file_name(self, backup_name):
         """ Create timestamped backup file name. """
         timestamp = time.strftime('%Y-%m-%d-%H%M')
-        return '%s-backup-%s.sql' % (backup_name, timestamp)
+        filename = '%s-backup-%s.sql' % (backup_name, timestamp)
+        if self.args.work_dir:
+            filename = os.path.join(self.args.work_dir, filename)
+        return filename
 
     def download_file(self, url, filename):
         """ Download file from url to filename. """
         self.print_message("Downloading to file '%s' from URL '%s'" % (filename, url))
-        try:
-            db_file = urllib2.urlopen(url)
-            with open(filename, 'wb') as output:
-                while True:
-                    chunk = db_file.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    output.write(chunk)
-            db_file.close()
-        except Exception as e:
-            self.error(str(e))
+        with self.phase('download') as phase:
+            try:
+                db_file = urllib2.urlopen(url)
+                with open(filename, 'wb') as output:
+                    while True:
+                        chunk = db_file.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        output.write(chunk)
+                db_file.close()
+            except Exception as e:
+                self.error(str(e))
+            phase['bytes'] = self.get_file_size(filename)
         self.print_message("File downloaded")
 
     def unzip_file_if_necessary(self, source_file):
         """ Unzip file if zipped. """
         if source_file.endswith(".gz"):
             self.print_message("Decompressing '%s'" % source_file)
-            subprocess.check_call(["gunzip", "--force", source_file])
-            source_file = source_file[:-len(".gz")]
+            with self.phase('unzip') as phase:
+                self.check_call(["gunzip", "--force", source_file])
+                source_file = source_file[:-len(".gz")]
+                phase['bytes'] = self.get_file_size(source_file)
         return source_file
 
+    def unzip_file_copy_if_necessary(self, source_file):
+        """ Unzip a zipped file into the working directory, leaving the zipped file as it is,
+        and return the unzipped file name. """
+        if not source_file.endswith(".gz"):
+            return source_file
+        unzipped_file = os.path.join(self.args.work_dir or os.path.dirname(source_file),
+                                     os.path.basename(source_file)[:-len(".gz")])
+        self.print_message("Decompressing '%s' to '%s'" % (source_file, unzipped_file))
+        with self.phase('unzip') as phase:
+            self.check_call(["bash", "-o", "pipefail", "-c", "gunzip --stdout %s > %s"
+                             % (shell_quote(source_file), shell_quote(unzipped_file))])
+            phase['bytes'] = self.get_file_size(unzipped_file)
+        return unzipped_file
+
     def download_file_from_url(self, source_app, url):
         """ Download file from source app or url, and return local filename. """
         if source_app:
@@ -147,12 +376,13 @@ class Command(object):
         self.download_file(url, filename)
         return filename
 
-    def dump_database(self):
+    def dump_database(self, schema_only=False):
         """ Create dumpfile from postgres database, and return filename. """
+        if self.args.ssh:
+            return self.dump_database_over_ssh(schema_only=schema_only)
         db_file = self.create_file_name(self.databases['source']['name'])
         self.print_message("Dumping postgres database '%s' to file '%s'"
                            % (self.databases['source']['name'], db_file))
-        self.export_pgpassword('source')
         args = [
             "pg_dump",
             "-Fc",
@@ -161,35 +391,182 @@ class Command(object):
             "--dbname=%s" % self.databases['source']['name'],
             "--file=%s" % db_file,
         ]
+        if schema_only:
+            args.append("--schema-only")
+        else:
+            compress_option = self.get_dump_compression_option()
+            if compress_option:
+                args.append(compress_option)
+        args.extend(self.databases['source']['args'])
+        with self.phase('dump') as phase:
+            self.check_call(args, db_key='source')
+            phase['bytes'] = self.get_file_size(db_file)
+        return db_file
+
+    def get_pg_dump_version(self):
+        """ Major version of the installed pg_dump. """
+        output = self.check_output(["pg_dump", "--version"]).decode('utf-8')
+        return compression.parse_pg_dump_version(output)
+
+    def get_compression_sample(self):
+        """ Rows from the largest source table, in COPY format, to calibrate compression. """
+        table = self.query_database(
+            'source',
+            "SELECT c.oid::regclass FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema') "
+            "ORDER BY pg_table_size(c.oid) DESC LIMIT 1")
+        if not table:
+            return b''
+        return self.query_database('source', "COPY (SELECT * FROM %s LIMIT %s) TO STDOUT"
+                                   % (table, COMPRESSION_SAMPLE_ROWS)).encode('utf-8')
+
+    def calibrate_compression(self, version):
+        """ Time writing a sample of the source data to the work directory, and compressing it
+        with each setting the installed pg_dump supports, then pick the setting with the least
+        estimated compress and write time for the whole dump. """
+        self.print_message("Calibrating dump compression")
+        sample = self.get_compression_sample()
+        if not sample:
+            self.print_message("No data to sample, using pg_dump's default compression")
+            return 'gzip', None
+        handle, sample_file = tempfile.mkstemp(prefix='paragres-sample-',
+                                               dir=self.args.work_dir or '.')
+        try:
+            start = time.time()
+            with os.fdopen(handle, 'wb') as output:
+                output.write(sample)
+                output.flush()
+                os.fsync(output.fileno())
+            sink_throughput = len(sample) / max(time.time() - start, 0.000001)
+            measurements = {}
+            for method, level in compression.get_candidates(version):
+                if method == 'none':
+                    measurements[(method, level)] = (len(sample), len(sample), 0)
+                    continue
+                start = time.time()
+                try:
+                    compressed = self.check_output(
+                        compression.get_compress_command(method, level, sample_file))
+                except OSError:
+                    # The command line tool is not installed, so the setting cannot be timed
+                    continue
+                measurements[(method, level)] = (len(sample), len(compressed), time.time() - start)
+        finally:
+            os.remove(sample_file)
+
+        method, level = compression.choose_setting(measurements, sink_throughput)
+        sample_bytes, compressed_bytes, seconds = measurements[(method, level)]
+        self.print_message("Chose %s from a %s sample: %.1fx smaller, compressing at %s/s, "
+                           "writing at %s/s"
+                           % (compression.format_setting(method, level), format_bytes(sample_bytes),
+                              float(sample_bytes) / max(compressed_bytes, 1),
+                              format_bytes(sample_bytes / max(seconds, 0.000001))
+                              if seconds else 'no cost',
+                              format_bytes(sink_throughput)))
+        return method, level
+
+    def get_dump_compression_option(self):
+        """ pg_dump --compress argument for --compression, or None for pg_dump's default. """
+        if not self.args.compression:
+            return None
+        method, level = compression.parse_setting(self.args.compression)
+        version = self.get_pg_dump_version()
+        if method == 'auto':
+            method, level = self.calibrate_compression(version)
+        elif not compression.supports_method(method, version):
+            self.error("pg_dump %s does not support %s compression (version %s or later is "
+                       "required)" % (version, method, compression.LZ4_ZSTD_VERSION))
+        self.print_message("Dump compression: %s" % compression.format_setting(method, level))
+        return compression.get_pg_dump_option(method, level)
+
+    def dump_database_over_ssh(self, schema_only=False):
+        """ Run pg_dump on the SSH host and stream the dump back, compressed in transit, into
+        a local file. The remote pg_dump uses the remote host's PostgreSQL authentication. """
+        db_file = self.create_file_name(self.databases['source']['name'])
+        transport = self.args.ssh_compression or 'gzip'
+        compress, decompress = TRANSPORT_COMPRESSION[transport]
+        self.print_message("Dumping postgres database '%s' on '%s' to file '%s' (%s transport "
+                           "compression)" % (self.databases['source']['name'], self.args.ssh,
+                                             db_file, transport))
+        args = [
+            "pg_dump",
+            "-Fc",
+            "--no-acl",
+            "--no-owner",
+            "--dbname=%s" % self.databases['source']['name'],
+        ]
+        if schema_only:
+            args.append("--schema-only")
         args.extend(self.databases['source']['args'])
-        subprocess.check_call(args)
+        remote_command = ' '.join(shell_quote(arg) for arg in args)
+        if compress:
+            # The transport compresses the dump, so pg_dump does not need to
+            remote_command = '%s --compress=0 | %s' % (remote_command, compress)
+            remote_command = 'bash -o pipefail -c %s' % shell_quote(remote_command)
+        command = 'ssh -- %s %s' % (shell_quote(self.args.ssh), shell_quote(remote_command))
+        if decompress:
+            command = '%s | %s' % (command, decompress)
+        command = '%s > %s' % (command, shell_quote(db_file))
+        with self.phase('dump') as phase:
+            self.check_call(["bash", "-o", "pipefail", "-c", command])
+            phase['bytes'] = self.get_file_size(db_file)
         return db_file
 
+    def terminate_connections(self):
+        """ Disconnect other sessions from the destination database so it can be dropped. """
+        name = self.databases['destination']['name']
+        self.print_message("Disconnecting other sessions from database '%s'" % name)
+        self.query_database('destination',
+                            "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                            "WHERE datname = %s AND pid <> pg_backend_pid()" % quote_literal(name),
+                            dbname=MAINTENANCE_DB)
+
     def drop_database(self):
         """ Drop postgres database. """
         self.print_message("Dropping database '%s'" % self.databases['destination']['name'])
-        self.export_pgpassword('destination')
-        args = [
-            "dropdb",
-            "--if-exists",
-            self.databases['destination']['name'],
-        ]
-        args.extend(self.databases['destination']['args'])
-        subprocess.check_call(args)
+        with self.phase('drop'):
+            if self.args.terminate_connections:
+                self.terminate_connections()
+            if self.get_admin_session('destination', dbname=MAINTENANCE_DB):
+                self.query_database('destination', 'DROP DATABASE IF EXISTS %s'
+                                    % quote_identifier(self.databases['destination']['name']),
+                                    dbname=MAINTENANCE_DB)
+                return
+            args = [
+                "dropdb",
+                "--if-exists",
+                self.databases['destination']['name'],
+            ]
+            args.extend(self.databases['destination']['args'])
+            self.check_call(args, db_key='destination')
 
-    def create_database(self):
-        """ Create postgres database. """
+    def create_database(self, template=None):
+        """ Create postgres database, as a copy of the template database if given. """
         self.print_message("Creating database '%s'" % self.databases['destination']['name'])
-        self.export_pgpassword('destination')
-        args = [
-            "createdb",
-            self.databases['destination']['name'],
-        ]
-        args.extend(self.databases['destination']['args'])
+        owner = None
         for arg in self.databases['destination']['args']:
             if arg[:7] == '--user=':
-                args.append('--owner=%s' % arg[7:])
-        subprocess.check_call(args)
+                owner = arg[7:]
+        with self.phase('create'):
+            if self.get_admin_session('destination', dbname=MAINTENANCE_DB):
+                sql = 'CREATE DATABASE %s' % quote_identifier(
+                    self.databases['destination']['name'])
+                if owner:
+                    sql += ' OWNER %s' % quote_identifier(owner)
+                if template:
+                    sql += ' TEMPLATE %s' % quote_identifier(template)
+                self.query_database('destination', sql, dbname=MAINTENANCE_DB)
+                return
+            args = [
+                "createdb",
+                self.databases['destination']['name'],
+            ]
+            args.extend(self.databases['destination']['args'])
+            if owner:
+                args.append('--owner=%s' % owner)
+            if template:
+                args.append('--template=%s' % template)
+            self.check_call(args, db_key='destination')
 
     def replace_postgres_db(self, file_url):
         """ Replace postgres database with database from specified source. """
@@ -213,15 +590,212 @@ class Command(object):
 
         self.print_message("Importing '%s' into database '%s'"
                            % (source_file, self.databases['destination']['name']))
+        with self.phase('restore') as phase:
+            self.restore_database(source_file)
+            phase['bytes'] = self.get_file_size(source_file)
+
+    def run_pg_restore(self, source_file, options=None):
+        """ Restore (part of) a dump file into the destination database. """
         args = [
             "pg_restore",
             "--no-acl",
             "--no-owner",
             "--dbname=%s" % self.databases['destination']['name'],
-            source_file,
         ]
+        if self.args.jobs:
+            args.append("--jobs=%s" % self.args.jobs)
+        args.extend(options or [])
+        args.append(source_file)
         args.extend(self.databases['destination']['args'])
-        subprocess.check_call(args)
+        self.check_call(args, db_key='destination')
+
+    def run_sql_file(self, db_key, filename):
+        """ Run a file of SQL statements with psql, stopping at the first error. """
+        args = [
+            "psql",
+            "--no-psqlrc",
+            "--quiet",
+            "--set=ON_ERROR_STOP=1",
+            "--dbname=%s" % self.databases[db_key]['name'],
+            "--file=%s" % filename,
+        ]
+        args.extend(self.databases[db_key]['args'])
+        self.check_call(args, db_key=db_key)
+
+    def make_tables_unlogged(self, sql):
+        """ Rewrite CREATE TABLE statements in schema SQL to create unlogged tables.
+        Partitioned tables cannot be unlogged, so they are left alone. """
+        lines = []
+        statement = []
+        for line in sql.splitlines(True):
+            if statement or line.startswith('CREATE TABLE '):
+                statement.append(line)
+                if line.rstrip().endswith(';'):
+                    text = ''.join(statement)
+                    if not re.search(r'^\)? ?PARTITION BY ', text, re.MULTILINE):
+                        text = 'CREATE UNLOGGED TABLE ' + text[len('CREATE TABLE '):]
+                    lines.append(text)
+                    statement = []
+            else:
+                lines.append(line)
+        return ''.join(lines + statement)
+
+    def set_tables_logged(self, tables=None):
+        """ Convert unlogged tables in the destination database to logged tables, either all of
+        them or only those named in tables. """
+        sql = ("SELECT c.oid::regclass FROM pg_class c WHERE c.relkind = 'r' "
+               "AND c.relpersistence = 'u' ")
+        if tables:
+            sql += "AND c.oid IN (SELECT to_regclass(name) FROM unnest(ARRAY[%s]) name) " % (
+                ', '.join("'%s'" % table.replace("'", "''") for table in tables))
+        sql += "ORDER BY pg_relation_size(c.oid) DESC"
+        tables = [table for table in self.query_database('destination', sql).splitlines()
+                  if table]
+        if tables:
+            self.print_message("Converting %s unlogged tables to logged tables" % len(tables))
+            self.query_database('destination', '; '.join('ALTER TABLE %s SET LOGGED' % table
+                                                         for table in tables))
+
+    def restore_schema(self, source_file):
+        """ Create the tables and other objects of a dump file (its pre-data section), as
+        unlogged tables if requested. """
+        if not self.args.unlogged:
+            self.print_message("Creating schema")
+            self.run_pg_restore(source_file, ["--section=pre-data"])
+            return
+        self.print_message("Creating unlogged tables")
+        schema = self.check_output(["pg_restore", "--no-acl", "--no-owner", "--section=pre-data",
+                                    "--file=-", source_file]).decode('utf-8')
+        schema_file = '%s.pre-data.sql' % source_file
+        with open(schema_file, 'w') as output:
+            output.write(self.make_tables_unlogged(schema))
+        try:
+            self.run_sql_file('destination', schema_file)
+        finally:
+            os.remove(schema_file)
+
+    def restore_sections(self, source_file):
+        """ Restore the schema, data and then indexes and constraints as separate steps.
+        With --unlogged set-logged, tables are converted back before indexes and constraints
+        are created, which keeps the conversion cheap and avoids logged tables referencing
+        unlogged ones. """
+        self.restore_schema(source_file)
+        self.print_message("Loading data")
+        self.restore_section(source_file, 'data')
+        if self.args.unlogged == 'set-logged':
+            self.set_tables_logged()
+        self.print_message("Creating indexes and constraints")
+        self.restore_section(source_file, 'post-data')
+
+    def restore_section(self, source_file, section):
+        """ Restore one section of a dump file, reporting its critical path if sizes are
+        known. """
+        if self.relation_sizes is not None:
+            self.report_critical_path(self.read_toc(source_file, section), section)
+        self.run_pg_restore(source_file, ["--section=%s" % section])
+
+    def get_relation_sizes(self):
+        """ Bytes of each table and index in the source database. """
+        self.print_message("Reading table and index sizes from source database")
+        sizes = self.query_database(
+            'source',
+            "SELECT n.nspname, c.relname, CASE WHEN c.relkind IN ('i', 'I') "
+            "THEN pg_relation_size(c.oid) ELSE pg_table_size(c.oid) END "
+            "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind IN ('r', 'm', 'i') "
+            "AND n.nspname NOT IN ('pg_catalog', 'information_schema')")
+        return toc.parse_relation_sizes(sizes)
+
+    def report_critical_path(self, entries, name):
+        """ Report the predicted longest restore job and the tables and indexes it restores. """
+        jobs = self.args.jobs or 1
+        longest_bytes, longest_entries = toc.simulate_schedule(entries, self.relation_sizes, jobs)
+        critical_path = ', '.join(
+            '%s.%s (%s)' % (entry.schema, entry.tag,
+                            format_bytes(toc.get_entry_size(entry, self.relation_sizes)))
+            for entry in longest_entries if toc.get_entry_size(entry, self.relation_sizes))
+        self.print_message("Predicted longest of %s jobs for %s %s items restores %s"
+                           % (jobs, len(entries), name, format_bytes(longest_bytes)))
+        if critical_path:
+            self.print_message("Predicted critical path: %s" % critical_path)
+
+    def read_toc(self, source_file, section=None):
+        """ Items of one section, or all, of a dump file, as listed by pg_restore. """
+        args = ["pg_restore", "--list"]
+        if section:
+            args.append("--section=%s" % section)
+        listing = self.check_output(args + [source_file])
+        return toc.parse_toc(listing.decode('utf-8'))
+
+    def restore_toc_entries(self, source_file, entries, name):
+        """ Restore only the given items of a dump file, through a pg_restore list file. """
+        if not entries:
+            return
+        if self.relation_sizes is not None:
+            self.report_critical_path(entries, name)
+        list_file = '%s.%s.list' % (source_file, name)
+        toc.write_toc(entries, list_file)
+        try:
+            self.run_pg_restore(source_file, ["--use-list=%s" % list_file])
+        finally:
+            os.remove(list_file)
+
+    def signal_ready(self):
+        """ Tell whoever is waiting that the destination database can be used, by writing the
+        ready file and/or running the ready command. """
+        if self.args.ready_file:
+            with open(self.args.ready_file, 'w') as ready_file:
+                ready_file.write('%s\n' % int(time.time()))
+        if self.args.ready_command:
+            self.check_call(["sh", "-c", self.args.ready_command])
+
+    def restore_prioritized(self, source_file):
+        """ Restore the schema, then the data, indexes and constraints of the hot tables, and
+        signal that the database is ready before loading the remaining (cold) tables. Foreign
+        keys are left until the end since they may reference cold tables. """
+        tables = self.args.hot_tables
+        self.restore_schema(source_file)
+        data = self.read_toc(source_file, 'data')
+        post_data = self.read_toc(source_file, 'post-data')
+        post_data_sql = self.check_output(["pg_restore", "--section=post-data", "--file=-",
+                                           source_file]).decode('utf-8')
+        hot_data, hot_post_data, cold_data, cold_post_data = toc.split_priority(
+            data, post_data, tables, toc.parse_index_tables(post_data_sql))
+        for table in tables:
+            if not any(entry.desc == 'TABLE DATA' and entry.is_for_tables([table], {})
+                       for entry in hot_data):
+                self.print_message("Hot table '%s' is not in the dump" % table)
+        unlogged = self.args.unlogged == 'set-logged'
+
+        self.print_message("Loading hot tables: %s" % ', '.join(tables))
+        self.restore_toc_entries(source_file, hot_data, 'hot-data')
+        if unlogged:
+            self.set_tables_logged(tables)
+        self.restore_toc_entries(source_file, hot_post_data, 'hot-post-data')
+        self.print_message("Database '%s' is ready for use"
+                           % self.databases['destination']['name'])
+        self.signal_ready()
+
+        self.print_message("Loading remaining tables")
+        self.restore_toc_entries(source_file, cold_data, 'cold-data')
+        if unlogged:
+            self.set_tables_logged()
+        self.restore_toc_entries(source_file, cold_post_data, 'cold-post-data')
+
+    def restore_database(self, source_file):
+        """ Restore dump file into the destination database. """
+        if self.args.critical_path_report and self.relation_sizes is None:
+            self.relation_sizes = self.get_relation_sizes()
+        if self.args.hot_tables:
+            self.restore_prioritized(source_file)
+            return
+        if self.args.unlogged:
+            self.restore_sections(source_file)
+        else:
+            if self.relation_sizes is not None:
+                self.report_critical_path(self.read_toc(source_file), 'archive')
+            self.run_pg_restore(source_file)
+        self.signal_ready()
 
     def get_file_url_for_heroku_app(self, source_app):
         """ Get latest backup URL from heroku pg:backups (or pgbackups). """
@@ -237,24 +811,140 @@ class Command(object):
                 "pgbackups:url",
                 "--app=%s" % source_app,
             ]
-        return subprocess.check_output(args).strip().decode('ascii')
+        return self.check_output(args).strip().decode('ascii')
 
-    def capture_heroku_database(self):
-        """ Capture Heroku database backup. """
-        self.print_message("Capturing database backup for app '%s'" % self.args.source_app)
+    def get_database_url_for_heroku_app(self, app):
+        """ Get the postgres connection string for a Heroku app's database. """
+        self.print_message("Getting database URL for Heroku app '%s'" % app)
+        args = [
+            "heroku",
+            "config:get",
+            "DATABASE_URL",
+            "--app=%s" % app,
+        ]
+        return self.check_output(args).strip().decode('ascii')
+
+    def get_restore_jobs(self):
+        """ Number of parallel pg_restore jobs to use for a remote restore. """
+        if self.args.jobs:
+            return self.args.jobs
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def push_to_heroku_db(self, source_file):
+        """ Restore dump file directly into a Heroku app's database with parallel jobs. """
+        source_file = self.unzip_file_if_necessary(source_file)
+        database_url = self.get_database_url_for_heroku_app(self.args.destination_app)
+        # The password goes to pg_restore in its environment, not on its command line, where
+        # other users could see it
+        database_url, password = split_url_password(database_url)
+        self.databases['destination']['password'] = password
+        jobs = self.get_restore_jobs()
+        self.print_message("Restoring '%s' to database for Heroku app '%s' using %s jobs"
+                           % (source_file, self.args.destination_app, jobs))
+        args = [
+            "pg_restore",
+            "--no-acl",
+            "--no-owner",
+            "--jobs=%s" % jobs,
+            "--dbname=%s" % database_url,
+        ]
+        if self.args.verbosity >= 1:
+            # pg_restore reports each item as it is restored
+            args.append("--verbose")
+        args.append(source_file)
+        with self.phase('restore') as phase:
+            self.check_call(args, db_key='destination')
+            phase['bytes'] = self.get_file_size(source_file)
+
+    def get_latest_heroku_backup(self, source_app):
+        """ Get id and completion time of the most recent completed Heroku backup, if any. """
+        self.print_message("Checking latest backup for app '%s'" % source_app, verbosity_needed=2)
         args = [
             "heroku",
-            "pg:backups:capture",
-            "--app=%s" % self.args.source_app,
+            "pg:backups",
+            "--app=%s" % source_app,
         ]
         if self.args.use_pgbackups:
             args = [
                 "heroku",
-                "pgbackups:capture",
-                "--app=%s" % self.args.source_app,
-                "--expire",
+                "pgbackups",
+                "--app=%s" % source_app,
             ]
-        subprocess.check_call(args)
+        output = self.check_output(args).decode('utf-8')
+        for line in output.splitlines():
+            match = HEROKU_BACKUP_PATTERN.match(line)
+            if match:
+                # Backups are listed most recent first
+                return {
+                    'id': match.group('id'),
+                    'finished': parse_heroku_time(match.group('finished')),
+                }
+        return None
+
+    def is_heroku_backup_fresh(self):
+        """ Whether the source app has a completed backup within the freshness window. """
+        if self.args.max_backup_age is None:
+            return False
+        backup = self.get_latest_heroku_backup(self.args.source_app)
+        if not backup:
+            return False
+        age = time.time() - backup['finished']
+        if age > self.args.max_backup_age * 60:
+            self.print_message("Latest backup '%s' is %d minutes old, capturing a new one"
+                               % (backup['id'], age // 60))
+            return False
+        self.print_message("Using backup '%s' completed %d minutes ago"
+                           % (backup['id'], age // 60))
+        return True
+
+    def get_capture_lock_path(self, source_app):
+        """ Lock file shared by all paragres runs capturing backups for an app. """
+        return os.path.join(tempfile.gettempdir(), 'paragres-capture-%s.lock' % source_app)
+
+    def capture_heroku_database(self):
+        """ Capture Heroku database backup, unless a recent or concurrent one can be used. """
+        requested_at = time.time()
+        with open(self.get_capture_lock_path(self.args.source_app), 'a+') as lock_file:
+            if fcntl:
+                # Waits for any capture already in progress for this app
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                lock_file.seek(0)
+                last_capture = lock_file.read().strip()
+                if last_capture and float(last_capture) >= requested_at:
+                    self.print_message("Using backup captured by a concurrent paragres run "
+                                       "for app '%s'" % self.args.source_app)
+                    return
+                if self.is_heroku_backup_fresh():
+                    return
+
+                self.print_message("Capturing database backup for app '%s'"
+                                   % self.args.source_app)
+                args = [
+                    "heroku",
+                    "pg:backups:capture",
+                    "--app=%s" % self.args.source_app,
+                ]
+                if self.args.use_pgbackups:
+                    args = [
+                        "heroku",
+                        "pgbackups:capture",
+                        "--app=%s" % self.args.source_app,
+                        "--expire",
+                    ]
+                with self.phase('capture'):
+                    self.check_call(args)
+
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write('%s' % time.time())
+                lock_file.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
 
     def reset_heroku_database(self):
         """ Reset Heroku database. """
@@ -265,7 +955,8 @@ class Command(object):
             "--app=%s" % self.args.destination_app,
             "DATABASE_URL",
         ]
-        subprocess.check_call(args)
+        with self.phase('reset'):
+            self.check_call(args)
 
     def replace_heroku_db(self, file_url):
         """ Replace Heroku database with database from specified source. """
@@ -294,23 +985,261 @@ class Command(object):
                     self.args.destination_app,
                     file_url,
                 ]
-            subprocess.check_call(args)
-        else:
-            # TODO perhaps add support for file -> heroku by piping to pg:psql
+            with self.phase('heroku_restore'):
+                self.check_call(args)
+        elif self.databases['source']['name']:
             self.print_message("Pushing data from database '%s'" % self.databases['source']['name'])
-            self.print_message("NOTE: Any postgres authentication settings you passed to paragres "
-                               "will be ignored.\nIf desired, you can export PG* variables.\n"
-                               "You will be prompted for your psql password.")
-            args = [
-                "heroku",
-                "pg:push",
-                self.databases['source']['name'],
-                "DATABASE_URL",
-                "--app=%s" % self.args.destination_app,
-            ]
-            subprocess.check_call(args)
+            self.push_to_heroku_db(self.dump_database())
+        else:
+            self.print_message("Pushing data from local backup file %s" % self.args.file)
+            self.push_to_heroku_db(self.args.file)
+
+    def start_replication(self):
+        """ Copy the source schema to the destination, then subscribe the destination to a
+        publication of all source tables. The subscription copies the initial data and then
+        applies incremental changes. """
+        name = self.get_replication_name()
+        self.print_message("Setting up logical replication '%s' from '%s' to '%s'"
+                           % (name, self.databases['source']['name'],
+                              self.databases['destination']['name']))
+
+        schema_file = self.dump_database(schema_only=True)
+        self.drop_database()
+        self.create_database()
+        self.print_message("Importing schema from '%s' into database '%s'"
+                           % (schema_file, self.databases['destination']['name']))
+        args = [
+            "pg_restore",
+            "--no-acl",
+            "--no-owner",
+            "--dbname=%s" % self.databases['destination']['name'],
+            schema_file,
+        ]
+        args.extend(self.databases['destination']['args'])
+        self.check_call(args, db_key='destination')
+
+        self.print_message("Creating publication '%s' on source database" % name)
+        self.query_database('source', 'CREATE PUBLICATION %s FOR ALL TABLES' % name)
+        self.print_message("Creating subscription '%s' on destination database" % name)
+        conninfo = self.get_conninfo('source').replace("'", "''")
+        sql = "CREATE SUBSCRIPTION %s CONNECTION '%s' PUBLICATION %s" % (name, conninfo, name)
+        if self.is_same_cluster():
+            # Creating the slot as part of the subscription waits for transactions on the
+            # server to finish, including the one creating the subscription
+            self.query_database('source', "SELECT pg_create_logical_replication_slot('%s', "
+                                          "'pgoutput')" % name)
+            sql += ' WITH (create_slot = false)'
+        self.query_database('destination', sql)
+        self.print_message("Initial data copy has started, use --replication-lag to follow it")
+
+    def check_replication_lag(self):
+        """ Report how far the destination is behind the source, and how many tables are
+        still being copied. """
+        name = self.get_replication_name()
+        lag = self.query_database(
+            'source',
+            "SELECT coalesce(pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn), 0) "
+            "FROM pg_replication_slots WHERE slot_name = '%s'" % name)
+        if not lag:
+            self.error("No replication slot '%s' found on source database" % name)
+        copying = self.query_database(
+            'destination',
+            "SELECT count(*) FROM pg_subscription_rel r JOIN pg_subscription s "
+            "ON s.oid = r.srsubid WHERE s.subname = '%s' AND r.srsubstate <> 'r'" % name)
+        lag = int(float(lag))
+        self.print_message("Replication '%s' is %s bytes behind, %s tables still copying"
+                           % (name, lag, copying), verbosity_needed=0)
+        return {'lag_bytes': lag, 'tables_copying': int(copying)}
+
+    def stop_replication(self):
+        """ Drop the subscription (and its replication slot) and the publication. """
+        name = self.get_replication_name()
+        self.print_message("Dropping subscription '%s' on destination database" % name)
+        self.query_database('destination', 'DROP SUBSCRIPTION IF EXISTS %s' % name)
+        self.print_message("Dropping publication '%s' on source database" % name)
+        self.query_database('source', 'DROP PUBLICATION IF EXISTS %s' % name)
+
+    def get_source_key(self):
+        """ Identifies the source in the run history. """
+        if self.args.source_app:
+            return 'heroku:%s' % self.args.source_app
+        if self.args.url:
+            url = urlparse.urlparse(self.args.url)
+            return 'url:%s%s' % (url.netloc, url.path)
+        if self.args.ssh:
+            return 'ssh:%s:%s' % (self.args.ssh, self.databases['source']['name'])
+        if self.databases['source']['name']:
+            return 'db:%s@%s' % (self.databases['source']['name'],
+                                 self.databases['source']['connection'].get('host', 'localhost'))
+        return 'file:%s' % os.path.abspath(self.args.file or '')
+
+    def get_mode(self):
+        """ Kind of source and destination, e.g. 'url-to-postgres'. """
+        if self.args.source_app:
+            source = 'heroku'
+        elif self.args.url:
+            source = 'url'
+        elif self.args.ssh:
+            source = 'ssh'
+        elif self.databases['source']['name']:
+            source = 'db'
+        else:
+            source = 'file'
+        return '%s-to-%s' % (source, 'heroku' if self.args.destination_app else 'postgres')
+
+    def record_run(self, started_at, succeeded):
+        """ Add the run to the history, warning if it was much slower than usual. Replication
+        runs only dump the schema, so their phases would skew plans for full copies and are not
+        recorded. """
+        if not self.history or not self.phases:
+            return
+        if self.args.replicate or self.args.replication_lag or self.args.stop_replication:
+            return
+        run = create_run(self.get_source_key(), self.get_mode(), started_at, self.phases,
+                         succeeded)
+        slow = succeeded and self.history.is_slow(run)
+        self.history.append(run)
+        if slow:
+            self.print_message("WARNING: this run took %s, which is much slower than previous "
+                               "runs from the same source" % format_duration(run['duration']),
+                               verbosity_needed=0)
+
+    def get_url_size(self, url):
+        """ Size of the file at url, without downloading it. A one byte range request is used
+        because signed backup URLs only allow GET requests. None if the size is unknown,
+        including when the request fails; the download reports the error. """
+        request = urllib2.Request(url, headers={'Range': 'bytes=0-0'})
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.URLError:
+            return None
+        try:
+            content_range = response.headers.get('Content-Range')
+            if content_range and '/' in content_range:
+                return int(content_range.rsplit('/', 1)[1])
+            if response.headers.get('Content-Length'):
+                return int(response.headers.get('Content-Length'))
+            return None
+        finally:
+            response.close()
+
+    def get_free_space(self, directory):
+        stats = os.statvfs(directory)
+        return stats.f_bavail * stats.f_frsize
+
+    def create_plan(self, file_url):
+        """ Estimate the time of each phase and the peak scratch disk use of this run. """
+        history = self.history or RunHistory(None)
+        source = self.get_source_key()
+        mode = self.get_mode()
+        compressed = (file_url or self.args.file or '').endswith('.gz')
+        unzip_ratio = history.get_ratio('unzip', 'download', source) or UNZIP_RATIO
+
+        if file_url:
+            source_size = self.get_url_size(file_url)
+        elif self.databases['source']['name']:
+            source_size = history.get_last_bytes('dump', source)
+            if not source_size:
+                database_size = self.query_database(
+                    'source', 'SELECT pg_database_size(current_database())')
+                source_size = int(int(database_size) * DUMP_SIZE_RATIO)
+        else:
+            source_size = self.get_file_size(self.args.file)
+        restore_size = source_size
+        if compressed and source_size:
+            restore_size = int(source_size * unzip_ratio)
+
+        steps = []
+        if self.args.capture:
+            steps.append(('capture', None))
+        if self.args.destination_app:
+            steps.append(('reset', None))
+        if file_url and self.args.destination_app:
+            steps.append(('heroku_restore', None))
+        else:
+            if file_url:
+                steps.append(('download', source_size))
+            elif self.databases['source']['name']:
+                steps.append(('dump', source_size))
+            if not self.args.destination_app:
+                steps.extend([('drop', None), ('create', None)])
+            if compressed:
+                steps.append(('unzip', restore_size))
+            steps.append(('restore', restore_size))
+
+        phases = []
+        for name, size in steps:
+            throughput = history.get_throughput(name, source)
+            if size and throughput:
+                duration = size / throughput
+            else:
+                duration = history.get_duration(name, source)
+            phases.append({'phase': name, 'bytes': size, 'duration': duration})
+        durations = [phase['duration'] for phase in phases]
+
+        # Downloaded or dumped files, plus decompressed output (gunzip keeps the compressed file
+        # until it has finished)
+        scratch = sum(size or 0 for name, size in steps if name in ['download', 'dump', 'unzip'])
+        work_dir = self.args.work_dir or os.getcwd()
+        return {
+            'source': source,
+            'mode': mode,
+            'phases': phases,
+            'duration': None if None in durations else sum(durations),
+            'scratch_bytes': scratch,
+            'work_dir': work_dir,
+            'free_bytes': self.get_free_space(work_dir),
+            'previous_runs': len(history.get_matching_runs(source, mode)),
+            'median_duration': median([run['duration'] for run in
+                                       history.get_matching_runs(source, mode)]),
+        }
+
+    def print_plan(self, file_url):
+        """ Show the estimated time and scratch disk use of this run, and check that there is
+        enough free space for it. """
+        plan = self.create_plan(file_url)
+        self.print_message("Plan for %s (%s), based on %s previous runs:"
+                           % (plan['source'], plan['mode'], plan['previous_runs']),
+                           verbosity_needed=0)
+        for phase in plan['phases']:
+            size = format_bytes(phase['bytes']) if phase['bytes'] else ''
+            self.print_message("  %-15s %15s  %s" % (phase['phase'], size,
+                                                     format_duration(phase['duration'])),
+                               verbosity_needed=0)
+        self.print_message("Estimated total time: %s" % format_duration(plan['duration']),
+                           verbosity_needed=0)
+        if plan['median_duration'] is not None:
+            self.print_message("Median time of previous runs: %s"
+                               % format_duration(plan['median_duration']), verbosity_needed=0)
+        self.print_message("Peak scratch disk use: %s in '%s' (%s free)"
+                           % (format_bytes(plan['scratch_bytes']), plan['work_dir'],
+                              format_bytes(plan['free_bytes'])), verbosity_needed=0)
+        if plan['scratch_bytes'] > plan['free_bytes']:
+            self.error("Not enough free disk space in '%s': need %s, have %s"
+                       % (plan['work_dir'], format_bytes(plan['scratch_bytes']),
+                          format_bytes(plan['free_bytes'])))
+        return plan
 
     def run(self):
+        """ Replace a database with the data from the specified source, profiling the run and
+        recording it in the history if requested. """
+        self.phases = []
+        started_at = time.time()
+        if self.profiler:
+            self.profiler.start()
+        succeeded = False
+        try:
+            self.synchronize()
+            succeeded = True
+        finally:
+            self.sessions.close()
+            if self.profiler:
+                self.profiler.stop()
+                self.profiler.write_report()
+                self.print_message("Profile written to '%s'" % self.profiler.report_file)
+            self.record_run(started_at, succeeded)
+
+    def synchronize(self):
         """ Replace a database with the data from the specified source. """
         self.print_message("\nBeginning database replacement process.\n")
 
@@ -322,6 +1251,23 @@ class Command(object):
             settings = self.parse_db_settings(self.args.settings)
             self.initialize_db_args(settings, 'destination')
 
+        if self.args.replicate:
+            self.start_replication()
+            return
+        if self.args.replication_lag:
+            self.check_replication_lag()
+            return
+        if self.args.stop_replication:
+            self.stop_replication()
+            return
+
+        if self.args.plan:
+            file_url = self.args.url
+            if self.args.source_app:
+                file_url = self.get_file_url_for_heroku_app(self.args.source_app)
+            self.print_plan(file_url)
+            return
+
         if self.args.capture:
             self.capture_heroku_database()
 
@@ -0,0 +1,76 @@
+import re
+
+# Level pg_dump uses for gzip when none is given
+DEFAULT_GZIP_LEVEL = 6
+
+# pg_dump supports lz4 and zstd compression from this major version
+LZ4_ZSTD_VERSION = 16
+
+# Settings tried by --compression auto, as (method, level)
+GZIP_CANDIDATES = [('none', None), ('gzip', 1), ('gzip', 6)]
+LZ4_ZSTD_CANDIDATES = [('lz4', 1), ('zstd', 1), ('zstd', 3), ('zstd', 9)]
+
+SETTING_PATTERN = re.compile(r'^(auto|none|gzip|lz4|zstd)(?::(\d+))?$')
+
+
+def parse_setting(setting):
+    """ Split a setting such as 'zstd:3' into method and level (None if not given), or
+    return None if it is not valid. """
+    match = SETTING_PATTERN.match(setting or '')
+    if not match or (match.group(2) and match.group(1) in ['auto', 'none']):
+        return None
+    level = match.group(2)
+    return match.group(1), int(level) if level else None
+
+
+def format_setting(method, level):
+    return method if level is None else '%s:%s' % (method, level)
+
+
+def parse_pg_dump_version(output):
+    """ Major version from 'pg_dump (PostgreSQL) 16.2', or None. """
+    match = re.search(r'(\d+)(?:\.\d+)*', output)
+    return int(match.group(1)) if match else None
+
+
+def supports_method(method, version):
+    if method in ['lz4', 'zstd']:
+        return version is not None and version >= LZ4_ZSTD_VERSION
+    return True
+
+
+def get_pg_dump_option(method, level):
+    """ pg_dump argument for a setting. gzip uses the numeric form, which all versions accept. """
+    if method == 'none':
+        return '--compress=0'
+    if method == 'gzip':
+        return '--compress=%s' % (DEFAULT_GZIP_LEVEL if level is None else level)
+    return '--compress=%s' % format_setting(method, level)
+
+
+def get_candidates(version):
+    if supports_method('zstd', version):
+        return GZIP_CANDIDATES + LZ4_ZSTD_CANDIDATES
+    return list(GZIP_CANDIDATES)
+
+
+def get_compress_command(method, level, filename):
+    """ Command line tool that compresses like pg_dump would, used to time a sample. """
+    return {
+        'gzip': ['gzip', '-c', '-%s' % level, filename],
+        'lz4': ['lz4', '-c', '-%s' % level, filename],
+        'zstd': ['zstd', '-c', '-q', '-%s' % level, filename],
+    }[method]
+
+
+def estimate_time(size, measurement, sink_throughput):
+    """ Seconds to compress size bytes and write the result, from a sample measurement of
+    (sample bytes, compressed bytes, compress seconds). """
+    sample_bytes, compressed_bytes, seconds = measurement
+    return size * (seconds + compressed_bytes / float(sink_throughput)) / sample_bytes
+
+
+def choose_setting(measurements, sink_throughput):
+    """ The (method, level) whose measurement gives the least compress and write time. """
+    return min(measurements,
+               key=lambda setting: estimate_time(1, measurements[setting], sink_throughput))
@@ -0,0 +1,146 @@
+import json
+import os
+import time
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.expanduser('~'), '.paragres', 'history.jsonl')
+
+# A run is flagged as slow when its throughput is this much worse than the historical median
+SLOW_RUN_FACTOR = 1.5
+
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def format_bytes(value):
+    if value is None:
+        return 'unknown size'
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(value) < 1024:
+            return '%.1f %s' % (value, unit)
+        value /= 1024.0
+    return '%.1f TB' % value
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'unknown'
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return '%ds' % seconds
+    if seconds < 3600:
+        return '%dm%02ds' % (seconds // 60, seconds % 60)
+    return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+
+
+class RunHistory(object):
+    """ Local record of past runs, one JSON object per line, used to predict run time and
+    scratch disk use and to spot unusually slow runs. A path of None is an empty history. """
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE):
+        self.path = path
+        self._runs = None
+
+    def get_runs(self):
+        if self._runs is None:
+            self._runs = []
+            if self.path and os.path.exists(self.path):
+                with open(self.path) as history_file:
+                    for line in history_file:
+                        try:
+                            self._runs.append(json.loads(line))
+                        except ValueError:
+                            # Ignore a partially written line
+                            pass
+        return self._runs
+
+    def append(self, run):
+        runs = self.get_runs()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, 'a') as history_file:
+            history_file.write('%s\n' % json.dumps(run, sort_keys=True))
+        runs.append(run)
+
+    def get_matching_runs(self, source=None, mode=None):
+        return [run for run in self.get_runs() if run.get('succeeded')
+                and (source is None or run['source'] == source)
+                and (mode is None or run['mode'] == mode)]
+
+    def get_phases(self, name, source=None):
+        """ Recorded phases with the given name, from the same source if there are any. """
+        for runs in [self.get_matching_runs(source=source), self.get_matching_runs()]:
+            phases = [phase for run in runs for phase in run['phases'] if phase['phase'] == name]
+            if phases:
+                return phases
+        return []
+
+    def get_throughput(self, name, source=None):
+        """ Median bytes per second of a phase, or None if it has never been measured. """
+        return median([phase['bytes'] / phase['duration'] for phase in
+                       self.get_phases(name, source=source)
+                       if phase.get('bytes') and phase['duration'] > 0])
+
+    def get_duration(self, name, source=None):
+        """ Median duration in seconds of a phase, or None if it has never run. """
+        return median([phase['duration'] for phase in self.get_phases(name, source=source)])
+
+    def get_ratio(self, numerator, denominator, source=None):
+        """ Median ratio of the bytes of two phases within the same runs, e.g. how much
+        unzipping expands a downloaded file. """
+        ratios = []
+        for runs in [self.get_matching_runs(source=source), self.get_matching_runs()]:
+            for run in runs:
+                sizes = dict((phase['phase'], phase.get('bytes')) for phase in run['phases'])
+                if sizes.get(numerator) and sizes.get(denominator):
+                    ratios.append(float(sizes[numerator]) / sizes[denominator])
+            if ratios:
+                return median(ratios)
+        return None
+
+    def get_last_bytes(self, name, source):
+        """ Bytes handled by the phase in the most recent run from this source. """
+        for run in reversed(self.get_matching_runs(source=source)):
+            for phase in run['phases']:
+                if phase['phase'] == name and phase.get('bytes'):
+                    return phase['bytes']
+        return None
+
+    def is_slow(self, run):
+        """ Whether a finished run was much slower than previous runs of the same source and
+        mode, comparing throughput when sizes are known and duration otherwise. """
+        previous = [other for other in self.get_matching_runs(run['source'], run['mode'])
+                    if other is not run]
+        if not previous:
+            return False
+        if run.get('source_bytes') and all(other.get('source_bytes') for other in previous):
+            baseline = median([other['source_bytes'] / other['duration'] for other in previous
+                               if other['duration'] > 0])
+            throughput = run['source_bytes'] / max(run['duration'], 0.001)
+            return bool(baseline) and throughput * SLOW_RUN_FACTOR < baseline
+        baseline = median([other['duration'] for other in previous])
+        return run['duration'] > baseline * SLOW_RUN_FACTOR
+
+
+def create_run(source, mode, started_at, phases, succeeded):
+    source_bytes = None
+    for phase in phases:
+        if phase['phase'] in ['download', 'dump', 'restore'] and phase.get('bytes'):
+            source_bytes = phase['bytes']
+            break
+    return {
+        'source': source,
+        'mode': mode,
+        'started_at': started_at,
+        'duration': time.time() - started_at,
+        'phases': phases,
+        'source_bytes': source_bytes,
+        'succeeded': succeeded,
+    }
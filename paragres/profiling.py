@@ -0,0 +1,117 @@
+import cProfile
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+try:
+    # Python 2; io.StringIO also exists there, but only accepts unicode
+    from StringIO import StringIO
+except ImportError:
+    # Python 3
+    from io import StringIO
+
+
+def get_exit_code(status):
+    """ Convert a wait status into a subprocess-style return code. """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def get_process_name(args):
+    """ Short name for a child process, e.g. 'pg_restore' or 'heroku pg:reset'. """
+    if args[0] == 'heroku' and len(args) > 1:
+        return ' '.join(args[:2])
+    return args[0]
+
+
+class RunProfiler(object):
+    """ Records wall time and resource usage of each child process in a run, optionally
+    profiles paragres itself, and writes everything to a single JSON report. """
+    python_stats_limit = 40
+
+    def __init__(self, report_file, profile_python=False):
+        self.report_file = report_file
+        self.profile_python = profile_python
+        self.processes = []
+        self.python_profile = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.processes = []
+        self.started_at = time.time()
+        self.finished_at = None
+        if self.profile_python:
+            self.python_profile = cProfile.Profile()
+            self.python_profile.enable()
+
+    def stop(self):
+        if self.python_profile:
+            self.python_profile.disable()
+        self.finished_at = time.time()
+
+    def wait(self, process, args, start):
+        """ Reap the child, recording its own resource usage, and check its exit code. """
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = get_exit_code(status)
+        max_rss = rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            # Reported in bytes on macOS, kilobytes elsewhere
+            max_rss //= 1024
+        self.processes.append({
+            'process': get_process_name(args),
+            'wall_time': time.time() - start,
+            'user_time': rusage.ru_utime,
+            'system_time': rusage.ru_stime,
+            'max_rss_kb': max_rss,
+            'blocks_in': rusage.ru_inblock,
+            'blocks_out': rusage.ru_oublock,
+            'exit_code': process.returncode,
+        })
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, args)
+
+    def check_call(self, args, **kwargs):
+        """ Profiled equivalent of subprocess.check_call. """
+        start = time.time()
+        process = subprocess.Popen(args, **kwargs)
+        self.wait(process, args, start)
+        return 0
+
+    def check_output(self, args, **kwargs):
+        """ Profiled equivalent of subprocess.check_output. """
+        start = time.time()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, **kwargs)
+        output = process.stdout.read()
+        process.stdout.close()
+        self.wait(process, args, start)
+        return output
+
+    def get_python_stats(self):
+        """ Text summary of the most expensive paragres functions, by cumulative time. """
+        stream = StringIO()
+        stats = pstats.Stats(self.python_profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.python_stats_limit)
+        return stream.getvalue()
+
+    def get_report(self):
+        totals = {}
+        for key in ['wall_time', 'user_time', 'system_time', 'blocks_in', 'blocks_out']:
+            totals[key] = sum(process[key] for process in self.processes)
+        totals['max_rss_kb'] = max([process['max_rss_kb'] for process in self.processes] or [0])
+        report = {
+            'started_at': self.started_at,
+            'wall_time': self.finished_at - self.started_at,
+            'processes': self.processes,
+            'process_totals': totals,
+        }
+        if self.python_profile:
+            report['python_profile'] = self.get_python_stats()
+        return report
+
+    def write_report(self):
+        with open(self.report_file, 'w') as output:
+            json.dump(self.get_report(), output, indent=2, sort_keys=True)
@@ -0,0 +1,198 @@
+"""
+pytest plugin which provisions a database per test process from one copy of a source:
+
+    pytest -n 16 --paragres-source heroku:myapp --paragres-settings test_settings.py
+
+The source is acquired (and, by default, restored into a template database) once per test run,
+however many pytest-xdist workers there are. Each worker then gets its own database, cloned
+from the template or restored from the shared dump, available from the session-scoped
+paragres_database fixture and dropped when the session ends.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from paragres import api
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, workers are not serialized while acquiring the source
+    fcntl = None
+
+SOURCE_KINDS = {
+    'file': 'file',
+    'url': 'url',
+    'heroku': 'heroku_app',
+    'db': 'dbname',
+    'settings': 'settings',
+}
+
+# Directory shared by the test run's processes, passed from the controller to xdist workers
+SHARED_DIR_VARIABLE = 'PARAGRES_PYTEST_DIR'
+
+
+def parse_source(value):
+    """ Source for a value such as 'heroku:myapp' or 'file:seed.dump'. """
+    kind, _, location = value.partition(':')
+    if kind not in SOURCE_KINDS or not location:
+        raise pytest.UsageError("--paragres-source must be one of %s, followed by ':' and a "
+                                "location, e.g. file:seed.dump"
+                                % ', '.join(sorted(SOURCE_KINDS)))
+    return api.Source(**{SOURCE_KINDS[kind]: location})
+
+
+class Provisioner(object):
+    """ Acquires the source once for all processes of a test run, under a file lock in the
+    shared directory, and provisions and drops the per-process databases. """
+
+    def __init__(self, source, shared_dir, prefix='paragres_test', clone='template',
+                 settings=None, jobs=None):
+        self.source = source
+        self.shared_dir = shared_dir
+        self.prefix = prefix
+        self.clone = clone
+        self.settings = settings
+        self.jobs = jobs
+
+    def get_template_name(self):
+        return '%s_template' % self.prefix
+
+    def get_database_name(self, worker_id):
+        return '%s_%s' % (self.prefix, worker_id)
+
+    def get_state_path(self):
+        return os.path.join(self.shared_dir, 'state.json')
+
+    def create_command(self, dbname):
+        """ Command for administering a test database on the destination server. """
+        command = api.create_command(api.Source(file='unused'),
+                                     api.Destination(dbname=dbname, settings=self.settings))
+        if self.settings:
+            command.initialize_db_args(command.parse_db_settings(self.settings), 'destination')
+        return command
+
+    def acquire(self):
+        """ Fetch the source and restore the template, unless another process already has,
+        and return the shared state. """
+        with open(os.path.join(self.shared_dir, 'lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.get_state_path()):
+                    with open(self.get_state_path()) as state_file:
+                        return json.load(state_file)
+                state = {'file': api.fetch_source(self.source, self.shared_dir)}
+                if self.clone == 'template':
+                    api.sync(api.Source(file=state['file']),
+                             api.Destination(dbname=self.get_template_name(),
+                                             settings=self.settings),
+                             jobs=self.jobs, work_dir=self.shared_dir)
+                    state['template'] = self.get_template_name()
+                with open(self.get_state_path(), 'w') as state_file:
+                    json.dump(state, state_file)
+                return state
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def provision(self, worker_id):
+        """ Create this process' database and return its name. """
+        state = self.acquire()
+        name = self.get_database_name(worker_id)
+        if state.get('template'):
+            command = self.create_command(name)
+            try:
+                command.drop_database()
+                command.create_database(template=state['template'])
+            finally:
+                command.sessions.close()
+        else:
+            api.sync(api.Source(file=state['file']),
+                     api.Destination(dbname=name, settings=self.settings),
+                     jobs=self.jobs, work_dir=self.shared_dir)
+        return name
+
+    def drop(self, name):
+        command = self.create_command(name)
+        try:
+            command.drop_database()
+        finally:
+            command.sessions.close()
+
+    def cleanup(self):
+        """ Drop the template and remove the shared files, once every process is done. """
+        if os.path.exists(self.get_state_path()):
+            with open(self.get_state_path()) as state_file:
+                state = json.load(state_file)
+            if state.get('template'):
+                self.drop(state['template'])
+        shutil.rmtree(self.shared_dir, ignore_errors=True)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('paragres', 'database provisioning with paragres')
+    group.addoption('--paragres-source', help='Source of the test databases: file:PATH, '
+                                              'url:URL, heroku:APP, db:NAME or settings:FILE')
+    group.addoption('--paragres-settings', help='Django-style settings file with the '
+                                                'connection for test databases')
+    group.addoption('--paragres-prefix', help='Prefix of test database names '
+                                              '(default: paragres_test)')
+    group.addoption('--paragres-clone', choices=['template', 'restore'],
+                    help='Clone each database from a template (default) or restore each one '
+                         'from the dump')
+    group.addoption('--paragres-jobs', type=int, help='Parallel pg_restore jobs per restore')
+    parser.addini('paragres_source', 'Source of the test databases')
+    parser.addini('paragres_settings', 'Settings file with the test database connection')
+    parser.addini('paragres_prefix', 'Prefix of test database names')
+    parser.addini('paragres_clone', 'template or restore')
+
+
+def get_option(config, name):
+    return config.getoption('paragres_%s' % name) or config.getini('paragres_%s' % name) or None
+
+
+def get_worker_id(config):
+    workerinput = getattr(config, 'workerinput', None)
+    return workerinput['workerid'] if workerinput else 'main'
+
+
+def pytest_configure(config):
+    config._paragres = None
+    source = get_option(config, 'source')
+    if not source:
+        return
+    shared_dir = os.environ.get(SHARED_DIR_VARIABLE)
+    if not hasattr(config, 'workerinput'):
+        # The controller (or only) process creates the directory before any workers start
+        shared_dir = tempfile.mkdtemp(prefix='paragres-pytest-')
+        os.environ[SHARED_DIR_VARIABLE] = shared_dir
+    elif not shared_dir:
+        raise pytest.UsageError('paragres needs the %s directory from the pytest controller; '
+                                'workers on other hosts are not supported' % SHARED_DIR_VARIABLE)
+    config._paragres = Provisioner(parse_source(source), shared_dir,
+                                   prefix=get_option(config, 'prefix') or 'paragres_test',
+                                   clone=get_option(config, 'clone') or 'template',
+                                   settings=get_option(config, 'settings'),
+                                   jobs=config.getoption('paragres_jobs'))
+
+
+def pytest_unconfigure(config):
+    provisioner = getattr(config, '_paragres', None)
+    if provisioner and not hasattr(config, 'workerinput'):
+        provisioner.cleanup()
+        os.environ.pop(SHARED_DIR_VARIABLE, None)
+
+
+@pytest.fixture(scope='session')
+def paragres_database(request):
+    """ Name of this test process' own copy of the --paragres-source database. """
+    provisioner = request.config._paragres
+    if not provisioner:
+        raise pytest.UsageError('The paragres_database fixture requires --paragres-source')
+    name = provisioner.provision(get_worker_id(request.config))
+    yield name
+    provisioner.drop(name)
@@ -0,0 +1,432 @@
+"""
+Shared sync service. Accepts sync requests as JSON over HTTP, on a TCP port or a Unix socket,
+and runs them from a queue:
+
+    paragres-server --socket /run/paragres.sock --workers 4
+
+    POST /jobs      {"source": {"heroku_app": "app1"}, "destination": {"dbname": "ci_1"},
+                     "options": {"jobs": 4}}
+    GET  /jobs      all jobs
+    GET  /jobs/ID   one job
+    GET  /metrics   job counts, merged requests and shared sources
+
+source, destination and options are the arguments of paragres.api.Source, Destination and
+sync. A request identical to a queued or running one returns that job rather than starting
+another. Jobs restoring the same source into postgres share one capture, download or dump.
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+from paragres import api
+from paragres.command import CommandError
+
+# Options a request may set. Others could run commands or write files as the server's user
+# (e.g. ready_command, ssh, profile, history, work_dir), or do something other than restore
+# once.
+ALLOWED_OPTIONS = ['compression', 'critical_path_report', 'hot_tables', 'jobs',
+                   'no_admin_session', 'no_history', 'terminate_connections', 'unlogged',
+                   'use_pgbackups', 'verbosity']
+
+# Options that decide how a source is captured, downloaded or dumped. They are part of a shared
+# source's identity, and are not passed on when restoring from the shared file.
+FETCH_OPTIONS = ['compression', 'ssh', 'ssh_compression', 'use_pgbackups']
+
+
+def get_key(value):
+    """ Stable identity of a source, destination or options dictionary. """
+    return json.dumps(value, sort_keys=True)
+
+
+class Job(object):
+
+    def __init__(self, job_id, source, destination, options):
+        self.id = job_id
+        self.source = source
+        self.destination = destination
+        self.options = options
+        self.source_key = get_key([source, self.get_fetch_options()])
+        self.destination_key = get_key(destination)
+        self.key = get_key([source, destination, options])
+        self.status = 'queued'
+        self.requests = 1
+        self.shared_source = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def get_fetch_options(self):
+        return dict((name, value) for name, value in self.options.items()
+                    if name in FETCH_OPTIONS)
+
+    def get_restore_options(self):
+        return dict((name, value) for name, value in self.options.items()
+                    if name not in FETCH_OPTIONS)
+
+    def is_shareable(self):
+        """ Whether the source can be fetched once for several jobs: only restores into
+        postgres of a source that is not already a local file, and which do not read table
+        sizes from the source database. """
+        return (not self.source.get('file') and not self.destination.get('heroku_app')
+                and not self.options.get('critical_path_report'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'destination': self.destination,
+            'options': self.options,
+            'requests': self.requests,
+            'shared_source': self.shared_source,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class SourceCache(object):
+    """ Local copies of sources in use. The first job for a source captures, downloads or
+    dumps it; jobs for the same source which start before the last user finishes reuse the
+    file, which is removed once no job needs it. """
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.fetches = 0
+        self.shares = 0
+
+    def fetch(self, job, directory):
+        """ Bring the job's source to a local dump file in directory and return its path. """
+        return api.fetch_source(api.Source(**job.source), directory, **job.get_fetch_options())
+
+    def acquire(self, job):
+        with self.lock:
+            entry = self.entries.setdefault(job.source_key, {
+                'lock': threading.Lock(),
+                'directory': None,
+                'file': None,
+                'users': 0,
+            })
+            entry['users'] += 1
+        try:
+            with entry['lock']:
+                if entry['file'] is None:
+                    # Files are named by host or database name and the minute, so different
+                    # sources fetched at once could otherwise get the same path
+                    if entry['directory'] is None:
+                        entry['directory'] = tempfile.mkdtemp(dir=self.work_dir)
+                    entry['file'] = self.fetch(job, entry['directory'])
+                    with self.lock:
+                        self.fetches += 1
+                else:
+                    job.shared_source = True
+                    with self.lock:
+                        self.shares += 1
+        except Exception:
+            self.release(job)
+            raise
+        return entry['file']
+
+    def release(self, job):
+        with self.lock:
+            entry = self.entries[job.source_key]
+            entry['users'] -= 1
+            if entry['users']:
+                return
+            del self.entries[job.source_key]
+        if entry['directory']:
+            shutil.rmtree(entry['directory'], ignore_errors=True)
+
+
+class JobQueue(object):
+    """ Runs sync jobs on a fixed number of worker threads, with at most per_source jobs
+    for the same source and per_destination jobs for the same destination at once. Only the
+    keep_finished most recently finished jobs are kept. """
+
+    def __init__(self, workers=4, per_source=2, per_destination=1, work_dir=None,
+                 sync=api.sync, create_command=api.create_command, keep_finished=100):
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.per_source = per_source
+        self.per_destination = per_destination
+        self.owns_work_dir = not work_dir
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='paragres-server-')
+        self.sync = sync
+        self.create_command = create_command
+        self.sources = SourceCache(self.work_dir)
+        self.jobs = []
+        self.job_ids = itertools.count(1)
+        self.merged = 0
+        self.condition = threading.Condition()
+        self.threads = []
+        self.stopping = False
+
+    def submit(self, source, destination, options=None):
+        """ Queue a sync, or return the queued or running job for an identical request. """
+        options = options or {}
+        if not isinstance(options, dict):
+            raise TypeError('options must be an object')
+        for name in sorted(options):
+            if name not in ALLOWED_OPTIONS:
+                raise TypeError("Option '%s' is not allowed" % name)
+        # Fail early on unknown or invalid arguments rather than in a worker
+        self.create_command(api.Source(**source), api.Destination(**destination), **options)
+        job = Job(None, source, destination, options)
+        with self.condition:
+            for other in self.jobs:
+                if other.key == job.key and other.status in ['queued', 'running']:
+                    other.requests += 1
+                    self.merged += 1
+                    return other
+            job.id = str(next(self.job_ids))
+            self.jobs.append(job)
+            self.condition.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self.condition:
+            for job in self.jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def count_running(self, attribute, key):
+        return len([job for job in self.jobs
+                    if job.status == 'running' and getattr(job, attribute) == key])
+
+    def next_job(self):
+        """ The oldest queued job whose source and destination are below their limits. """
+        for job in self.jobs:
+            if (job.status == 'queued'
+                    and self.count_running('source_key', job.source_key) < self.per_source
+                    and self.count_running('destination_key', job.destination_key)
+                    < self.per_destination):
+                return job
+        return None
+
+    def run_job(self, job):
+        destination = api.Destination(**job.destination)
+        if not job.is_shareable():
+            self.sync(api.Source(**job.source), destination, **copy.deepcopy(job.options))
+            return
+        filename = self.sources.acquire(job)
+        try:
+            self.sync(api.Source(file=filename), destination,
+                      **copy.deepcopy(job.get_restore_options()))
+        finally:
+            self.sources.release(job)
+
+    def worker(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None and not self.stopping:
+                    self.condition.wait(1)
+                    job = self.next_job()
+                if self.stopping:
+                    return
+                job.status = 'running'
+                job.started_at = time.time()
+            try:
+                self.run_job(job)
+                status, error = 'succeeded', None
+            except Exception as e:
+                status, error = 'failed', str(e) or e.__class__.__name__
+            with self.condition:
+                job.status = status
+                job.error = error
+                job.finished_at = time.time()
+                self.prune()
+                self.condition.notify_all()
+
+    def prune(self):
+        """ Forget the oldest finished jobs beyond keep_finished. Call with the condition held. """
+        finished = sorted((job for job in self.jobs if job.status in ['succeeded', 'failed']),
+                          key=lambda job: job.finished_at)
+        expired = finished[:max(len(finished) - self.keep_finished, 0)]
+        if expired:
+            self.jobs = [job for job in self.jobs if job not in expired]
+
+    def start(self):
+        self.stopping = False
+        self.threads = [threading.Thread(target=self.worker) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """ Stop the workers once their current jobs finish. """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        if self.owns_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def wait(self, job, timeout=None):
+        """ Block until the job has finished, or timeout seconds have passed. """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while job.status in ['queued', 'running']:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                self.condition.wait(1)
+        return job
+
+    def get_metrics(self):
+        with self.condition:
+            statuses = {}
+            for job in self.jobs:
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            durations = [job.finished_at - job.started_at for job in self.jobs
+                         if job.status == 'succeeded']
+            return {
+                'jobs': statuses,
+                'requests': sum(job.requests for job in self.jobs),
+                'merged_requests': self.merged,
+                'source_fetches': self.sources.fetches,
+                'shared_sources': self.sources.shares,
+                'mean_duration': sum(durations) / len(durations) if durations else None,
+            }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return BaseHTTPRequestHandler.address_string(self)
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_json(self, status, value):
+        body = json.dumps(value, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        queue = self.server.queue
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            with queue.condition:
+                jobs = [job.to_dict() for job in queue.jobs]
+            self.send_json(200, jobs)
+        elif path.startswith('/jobs/'):
+            job = queue.get(path[len('/jobs/'):])
+            if job:
+                self.send_json(200, job.to_dict())
+            else:
+                self.send_json(404, {'error': 'No such job'})
+        elif path == '/metrics':
+            self.send_json(200, queue.get_metrics())
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = self.server.queue.submit(request.get('source') or {},
+                                           request.get('destination') or {},
+                                           request.get('options'))
+        except (AttributeError, CommandError, TypeError, ValueError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, job.to_dict())
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(queue, port=None, socket_path=None, host='127.0.0.1', verbose=False):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.queue = queue
+    server.verbose = verbose
+    return server
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Run a shared paragres sync service.')
+    parser.add_argument('--port', type=int, default=8432,
+                        help='Local TCP port to listen on (default: 8432)')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--socket', type=str, metavar='PATH',
+                        help='Listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--workers', type=int, default=4, help='Jobs to run at once')
+    parser.add_argument('--per-source', type=int, default=2,
+                        help='Jobs to run at once for the same source')
+    parser.add_argument('--per-destination', type=int, default=1,
+                        help='Jobs to run at once for the same destination')
+    parser.add_argument('--keep-finished', type=int, default=100, metavar='N',
+                        help='Finished jobs to keep for GET /jobs and /metrics (default: 100)')
+    parser.add_argument('--work-dir', type=str, metavar='DIR',
+                        help='Directory for shared source files (default: a temporary '
+                             'directory)')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help='Log each request')
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    if min(args.workers, args.per_source, args.per_destination) < 1:
+        sys.stderr.write('Worker and concurrency limits must be at least 1\n')
+        return 2
+    if args.keep_finished < 0:
+        sys.stderr.write('Finished jobs to keep (--keep-finished) cannot be negative\n')
+        return 2
+    queue = JobQueue(workers=args.workers, per_source=args.per_source,
+                     per_destination=args.per_destination, work_dir=args.work_dir,
+                     keep_finished=args.keep_finished)
+    server = create_server(queue, port=args.port, socket_path=args.socket, host=args.host,
+                           verbose=args.verbose)
+    queue.start()
+    print('paragres server listening on %s' % (args.socket or '%s:%s' % (args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.stop()
+    return 0
@@ -0,0 +1,12 @@
+import unittest
+
+from mock import patch
+
+
+class TestCase(unittest.TestCase):
+    """ Tests stand in for the PostgreSQL client tools by patching subprocess, so never use a
+    database driver that happens to be installed, which would connect to a real server. """
+
+    def run(self, result=None):
+        with patch('paragres.admin.psycopg2', None):
+            return super(TestCase, self).run(result)
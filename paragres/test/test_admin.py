@@ -0,0 +1,153 @@
+from mock import MagicMock, call, patch
+
+from paragres import admin
+from paragres.cli import create_parser
+from paragres.command import Command, CommandError
+from paragres.test import TestCase
+
+
+class DriverError(Exception):
+    pass
+
+
+def create_driver():
+    driver = MagicMock()
+    driver.Error = DriverError
+    cursor = driver.connect.return_value.cursor.return_value
+    cursor.description = None
+    return driver, cursor
+
+
+class TestAdminSession(TestCase):
+
+    def test_quote(self):
+        self.assertEqual('"my ""db"""', admin.quote_identifier('my "db"'))
+        self.assertEqual("'it''s'", admin.quote_literal("it's"))
+
+    def test_execute(self):
+        driver, cursor = create_driver()
+        cursor.description = [('relname', 19), ('unlogged', 16), ('size', 20)]
+        cursor.fetchall.return_value = [('accounts', 't', '8192'), ('events', 'f', None)]
+
+        with patch('paragres.admin.psycopg2', driver):
+            session = admin.AdminSession({'host': 'db1', 'user': 'admin'}, 'destdb',
+                                         password='secret')
+            result = session.execute('SELECT relname, unlogged, size FROM tables')
+
+        driver.connect.assert_called_once_with(host='db1', user='admin', dbname='destdb',
+                                               password='secret')
+        self.assertTrue(driver.connect.return_value.autocommit)
+        self.assertEqual((16, 19, 20), tuple(sorted(driver.extensions.new_type.call_args[0][0])))
+        self.assertEqual('accounts|t|8192\nevents|f|', result)
+
+    def test_execute_copy(self):
+        driver, cursor = create_driver()
+        cursor.copy_expert.side_effect = lambda sql, output: output.write(u'1\ta\n')
+
+        with patch('paragres.admin.psycopg2', driver):
+            result = admin.AdminSession({}, 'sourcedb').execute('COPY (SELECT 1) TO STDOUT')
+
+        self.assertEqual('1\ta\n', result)
+        self.assertFalse(cursor.execute.called)
+
+    def test_execute_error(self):
+        driver, cursor = create_driver()
+        cursor.execute.side_effect = DriverError('permission denied\n')
+
+        with patch('paragres.admin.psycopg2', driver):
+            session = admin.AdminSession({}, 'destdb')
+            with self.assertRaises(admin.AdminSessionError) as context:
+                session.execute('DROP DATABASE x')
+
+        self.assertEqual('permission denied', str(context.exception))
+        cursor.close.assert_called_once_with()
+
+
+class TestSessionPool(TestCase):
+
+    def test_get_without_driver(self):
+        with patch('paragres.admin.psycopg2', None):
+            self.assertEqual(None, admin.SessionPool().get({}, 'destdb'))
+
+    def test_get_reuses_sessions(self):
+        driver, _ = create_driver()
+
+        with patch('paragres.admin.psycopg2', driver):
+            pool = admin.SessionPool()
+            session = pool.get({'host': 'db1'}, 'postgres')
+            self.assertTrue(session is pool.get({'host': 'db1'}, 'postgres'))
+            pool.get({'host': 'db2'}, 'postgres')
+            pool.close()
+
+        self.assertEqual(2, driver.connect.call_count)
+        self.assertEqual(2, driver.connect.return_value.close.call_count)
+
+    def test_get_connection_failure(self):
+        driver, _ = create_driver()
+        driver.connect.side_effect = DriverError('no pg_hba.conf entry')
+        messages = []
+
+        with patch('paragres.admin.psycopg2', driver):
+            pool = admin.SessionPool(print_message=messages.append)
+            self.assertEqual(None, pool.get({}, 'postgres'))
+            self.assertEqual(None, pool.get({}, 'postgres'))
+
+        self.assertEqual(1, driver.connect.call_count)
+        self.assertEqual(["Could not open an admin session for database 'postgres' "
+                          "(no pg_hba.conf entry), using client tools"], messages)
+
+
+class TestCommandAdminSession(TestCase):
+
+    def setUp(self):
+        self.driver, self.cursor = create_driver()
+        patcher = patch('paragres.admin.psycopg2', self.driver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_command(self, *args):
+        command = Command(create_parser().parse_args(['-f', 'db.dump', '-n', 'destdb']
+                                                     + list(args)))
+        command.initialize_db_args({'USER': 'owner', 'PASSWORD': 'secret'}, 'destination')
+        return command
+
+    @patch('subprocess.check_call')
+    def test_drop_and_create_database(self, mock_check_call):
+        command = self.create_command('--terminate-connections')
+
+        command.drop_database()
+        command.create_database()
+
+        self.driver.connect.assert_called_once_with(user='owner', dbname='postgres',
+                                                    password='secret')
+        self.assertEqual([call("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                               "WHERE datname = 'destdb' AND pid <> pg_backend_pid()"),
+                          call('DROP DATABASE IF EXISTS "destdb"'),
+                          call('CREATE DATABASE "destdb" OWNER "owner"')],
+                         self.cursor.execute.call_args_list)
+        self.assertFalse(mock_check_call.called)
+
+    def test_query_database_error(self):
+        self.cursor.execute.side_effect = DriverError('relation "x" does not exist')
+        command = self.create_command()
+
+        with self.assertRaises(CommandError) as context:
+            command.query_database('destination', 'SELECT * FROM x')
+
+        self.assertEqual('Query failed on destination database: relation "x" does not exist',
+                         str(context.exception))
+        self.driver.connect.assert_called_once_with(user='owner', dbname='destdb',
+                                                    password='secret')
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.check_call')
+    def test_no_admin_session(self, mock_check_call, mock_check_output):
+        mock_check_output.return_value = b't\n'
+        command = self.create_command('--no-admin-session', '--terminate-connections')
+
+        command.drop_database()
+
+        self.assertFalse(self.driver.connect.called)
+        self.assertEqual('--dbname=postgres', mock_check_output.call_args[0][0][5])
+        self.assertEqual(['dropdb', '--if-exists', 'destdb', '--user=owner'],
+                         mock_check_call.call_args[0][0])
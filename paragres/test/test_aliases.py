@@ -0,0 +1,143 @@
+from mock import patch
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from paragres.aliases import AliasSync
+from paragres.cli import create_parser
+from paragres.command import CommandError
+from paragres.test import TestCase
+
+try:
+    # Python 2; io.StringIO also exists there, but only accepts unicode
+    from StringIO import StringIO
+except ImportError:
+    # Python 3
+    from io import StringIO
+
+
+SETTINGS = """DATABASES = {
+    'default': {'NAME': '%(prefix)s_main', 'USER': 'username'},
+    'analytics': {'NAME': '%(prefix)s_analytics'},
+    'archive': {'NAME': '%(prefix)s_archive'},
+    %(extra)s
+}
+"""
+
+
+class TestAliasSync(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_settings = self.write_settings('source.py', 'source', "'legacy': {},")
+        self.destination_settings = self.write_settings('destination.py', 'dest', '')
+        self.parser = create_parser()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_settings(self, filename, prefix, extra):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as settings:
+            settings.write(SETTINGS % {'prefix': prefix, 'extra': extra})
+        return path
+
+    def create_alias_sync(self, *args):
+        return AliasSync(self.parser.parse_args(
+            ['-o', self.source_settings, '-t', self.destination_settings, '-v', '0',
+             '--work-dir', self.directory, '--aliases'] + list(args)))
+
+    @patch('subprocess.check_call')
+    def test_run_all_aliases(self, mock_check_call):
+        running = []
+        most_running = []
+        lock = threading.Lock()
+
+        def check_call(args, env=None):
+            if args[0] == 'pg_dump':
+                with lock:
+                    running.append(args[4])
+                    most_running.append(len(running))
+            if args[0] == 'dropdb' and args[2] == 'dest_archive':
+                with lock:
+                    running.pop()
+                raise subprocess.CalledProcessError(1, 'dropdb')
+            if args[0] == 'pg_restore':
+                with lock:
+                    running.pop()
+        mock_check_call.side_effect = check_call
+        alias_sync = self.create_alias_sync('--alias-concurrency', '2')
+
+        results = alias_sync.run()
+
+        self.assertEqual(['analytics', 'archive', 'default'],
+                         [result['alias'] for result in results])
+        self.assertEqual([True, False, True], [result['succeeded'] for result in results])
+        self.assertTrue(max(most_running) <= 2)
+        dumped = sorted(args[0][0][4] for args in mock_check_call.call_args_list
+                        if args[0][0][0] == 'pg_dump')
+        self.assertEqual(['--dbname=source_analytics', '--dbname=source_archive',
+                          '--dbname=source_main'], dumped)
+        report = StringIO()
+        alias_sync.print_report(results, report)
+        self.assertTrue('archive              FAILED' in report.getvalue())
+        self.assertTrue(report.getvalue().startswith("\nAlias"))
+        self.assertTrue("archive: Command 'dropdb' returned non-zero exit status 1"
+                        in report.getvalue())
+
+    @patch('subprocess.check_call')
+    def test_run_selected_aliases(self, mock_check_call):
+        results = self.create_alias_sync('default').run()
+
+        self.assertEqual(['default'], [result['alias'] for result in results])
+        self.assertEqual(['pg_dump', '-Fc', '--no-acl', '--no-owner', '--dbname=source_main'],
+                         mock_check_call.call_args_list[0][0][0][:5])
+        self.assertEqual(['dropdb', '--if-exists', 'dest_main', '--user=username'],
+                         mock_check_call.call_args_list[1][0][0])
+
+    @patch('subprocess.check_call')
+    def test_each_alias_has_its_own_work_dir(self, mock_check_call):
+        self.create_alias_sync('default', 'analytics').run()
+
+        dumped = sorted(os.path.dirname(arg[len('--file='):])
+                        for args in mock_check_call.call_args_list if args[0][0][0] == 'pg_dump'
+                        for arg in args[0][0] if arg.startswith('--file='))
+        self.assertEqual([os.path.join(self.directory, 'analytics'),
+                          os.path.join(self.directory, 'default')], dumped)
+
+    @patch('subprocess.check_call')
+    def test_ready_file_written_once_all_aliases_succeed(self, mock_check_call):
+        ready_file = os.path.join(self.directory, 'ready')
+        alias_sync = self.create_alias_sync('--ready-file', ready_file)
+        written = []
+
+        def check_call(args, env=None):
+            written.append(os.path.exists(ready_file))
+        mock_check_call.side_effect = check_call
+
+        results = alias_sync.run()
+
+        self.assertEqual([True, True, True], [result['succeeded'] for result in results])
+        self.assertFalse(any(written))
+        self.assertTrue(os.path.exists(ready_file))
+
+    @patch('subprocess.check_call')
+    def test_ready_command_not_run_after_failure(self, mock_check_call):
+        def check_call(args, env=None):
+            if args[0] == 'dropdb' and args[2] == 'dest_archive':
+                raise subprocess.CalledProcessError(1, 'dropdb')
+        mock_check_call.side_effect = check_call
+
+        self.create_alias_sync('--ready-command', 'touch ready').run()
+
+        self.assertEqual([], [args for args in mock_check_call.call_args_list
+                              if args[0][0][0] == 'sh'])
+
+    def test_run_unknown_alias(self):
+        with self.assertRaises(CommandError) as context:
+            self.create_alias_sync('legacy').run()
+
+        self.assertEqual("Database alias 'legacy' must be in both the source and destination "
+                         "settings", str(context.exception))
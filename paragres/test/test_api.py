@@ -0,0 +1,180 @@
+from mock import call, patch
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+from paragres import api
+from paragres.command import CommandError
+from paragres.test import TestCase
+
+try:
+    import asyncio
+except ImportError:
+    # Python 2
+    asyncio = None
+
+
+class StringStartsWith(str):
+    def __eq__(self, other):
+        return other.find(self) == 0
+
+
+class TestCreateCommand(TestCase):
+
+    def test_create_command(self):
+        source = api.Source(heroku_app='app1', capture=True, max_backup_age=30)
+        destination = api.Destination(dbname='destdb')
+
+        command = api.create_command(source, destination, jobs=4)
+
+        self.assertEqual('app1', command.args.source_app)
+        self.assertTrue(command.args.capture)
+        self.assertEqual(30, command.args.max_backup_age)
+        self.assertEqual('destdb', command.databases['destination']['name'])
+        self.assertEqual(4, command.args.jobs)
+        self.assertEqual(0, command.args.verbosity)
+
+    def test_create_command_unknown_option(self):
+        self.assertRaises(TypeError, api.create_command, api.Source(file='db.sql'),
+                          api.Destination(dbname='destdb'), threads=4)
+
+    def test_create_command_invalid(self):
+        source = api.Source(file='db.sql', dbname='sourcedb')
+
+        with self.assertRaises(CommandError) as context:
+            api.create_command(source, api.Destination(dbname='destdb'))
+
+        self.assertTrue(str(context.exception).startswith('A postgres destination requires'))
+
+
+class TestSync(TestCase):
+
+    def setUp(self):
+        self.settings = {
+            'NAME': 'dbname',
+            'USER': 'username',
+            'PASSWORD': 'password1',
+        }
+
+    @patch('subprocess.check_call')
+    def test_sync(self, mock_check_call):
+        source = api.Source(dbname='sourcedb')
+        destination = api.Destination(settings=self.settings)
+
+        api.sync(source, destination)
+
+        dump_call = mock_check_call.call_args_list[0]
+        work_dir = os.path.dirname(dump_call[0][0][5][len('--file='):])
+        self.assertTrue(os.path.basename(work_dir).startswith('paragres-'))
+        self.assertFalse(os.path.exists(work_dir))
+        expected = call(['dropdb', '--if-exists', 'dbname', '--user=username'],
+                        env=dict(os.environ, PGPASSWORD='password1'))
+        self.assertEqual(expected, mock_check_call.call_args_list[1])
+        self.assertEqual(None, os.environ.get('PGPASSWORD'))
+
+    @patch('subprocess.check_call')
+    def test_sync_work_dir(self, mock_check_call):
+        api.sync(api.Source(dbname='sourcedb'), api.Destination(dbname='destdb'),
+                 work_dir='/tmp')
+
+        expected = call(['pg_dump', '-Fc', '--no-acl', '--no-owner', '--dbname=sourcedb',
+                         StringStartsWith('--file=/tmp/sourcedb-backup-')])
+        self.assertEqual(expected, mock_check_call.call_args_list[0])
+
+    @patch('subprocess.check_call')
+    def test_fetch_source_dumps_into_work_dir(self, mock_check_call):
+        filename = api.fetch_source(api.Source(dbname='sourcedb'), '/tmp')
+
+        self.assertTrue(filename.startswith('/tmp/sourcedb-backup-'))
+        mock_check_call.assert_called_once_with(
+            ['pg_dump', '-Fc', '--no-acl', '--no-owner', '--dbname=sourcedb',
+             '--file=%s' % filename])
+
+    @patch('subprocess.check_call')
+    def test_fetch_source_file_is_used_in_place(self, mock_check_call):
+        self.assertEqual('db.dump', api.fetch_source(api.Source(file='db.dump'), '/tmp'))
+        self.assertEqual(0, mock_check_call.call_count)
+
+    def test_fetch_source_zipped_file_is_left_in_place(self):
+        work_dir = tempfile.mkdtemp()
+        source_dir = tempfile.mkdtemp()
+        source_file = os.path.join(source_dir, 'seed.dump.gz')
+        with gzip.open(source_file, 'wb') as output:
+            output.write(b'PGDMP')
+
+        filename = api.fetch_source(api.Source(file=source_file), work_dir)
+
+        self.assertEqual(os.path.join(work_dir, 'seed.dump'), filename)
+        with open(filename, 'rb') as unzipped:
+            self.assertEqual(b'PGDMP', unzipped.read())
+        self.assertTrue(os.path.exists(source_file))
+        shutil.rmtree(work_dir)
+        shutil.rmtree(source_dir)
+
+    @patch('subprocess.check_call')
+    def test_sync_failure_raises(self, mock_check_call):
+        mock_check_call.side_effect = subprocess.CalledProcessError(1, 'dropdb')
+
+        self.assertRaises(subprocess.CalledProcessError, api.sync, api.Source(file='db.sql'),
+                          api.Destination(dbname='destdb'))
+
+    @patch('subprocess.check_call')
+    def test_concurrent_syncs_keep_own_credentials(self, mock_check_call):
+        passwords = {}
+        lock = threading.Lock()
+
+        def check_call(args, env=None):
+            if args[0] == 'dropdb':
+                with lock:
+                    passwords[args[2]] = env['PGPASSWORD']
+        mock_check_call.side_effect = check_call
+
+        threads = []
+        for index in range(10):
+            settings = {'NAME': 'db%s' % index, 'PASSWORD': 'password%s' % index}
+            thread = threading.Thread(target=api.sync, args=(api.Source(file='db.sql'),
+                                                             api.Destination(settings=settings)))
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = dict(('db%s' % index, 'password%s' % index) for index in range(10))
+        self.assertEqual(expected, passwords)
+
+    @unittest.skipIf(asyncio is None, 'asyncio requires Python 3')
+    @patch('subprocess.check_call')
+    def test_sync_async(self, mock_check_call):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        futures = [api.sync_async(api.Source(file='db.sql'), api.Destination(dbname='db%s' % i))
+                   for i in range(3)]
+
+        loop.run_until_complete(asyncio.gather(*futures))
+        loop.close()
+
+        self.assertEqual(9, mock_check_call.call_count)
+
+    @unittest.skipIf(asyncio is None or not hasattr(asyncio, 'get_running_loop'),
+                     'asyncio.get_running_loop requires Python 3.7')
+    @patch('subprocess.check_call')
+    def test_sync_async_uses_running_loop(self, mock_check_call):
+        loop = asyncio.new_event_loop()
+        other_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(other_loop)
+        futures = []
+        loop.call_soon(lambda: futures.append(
+            api.sync_async(api.Source(file='db.sql'), api.Destination(dbname='db'))))
+
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.run_until_complete(futures[0])
+        loop.close()
+        other_loop.close()
+        asyncio.set_event_loop(None)
+
+        self.assertTrue(futures[0].get_loop() is loop)
+        self.assertEqual(3, mock_check_call.call_count)
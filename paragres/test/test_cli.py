@@ -1,8 +1,11 @@
 from mock import call, patch
+import json
 import sys
-import unittest
+import tempfile
 
 from paragres import cli
+from paragres.command import CommandError
+from paragres.test import TestCase
 
 
 # Extract these to package, maybe even submit pr to mock
@@ -11,7 +14,7 @@ class StringStartsWith(str):
         return other.find(self) == 0
 
 
-class TestCli(unittest.TestCase):
+class TestCli(TestCase):
 
     def setUp(self):
         self.parser = cli.create_parser()
@@ -40,6 +43,14 @@ class TestCli(unittest.TestCase):
 
         self.assertEqual(None, error_message)
 
+    def test_verify_args_max_backup_age_without_capture(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--max-backup-age', '30'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'A maximum backup age (--max-backup-age) requires backup capture (-c)'
+        self.assertEqual(expected_error, error_message)
+
     def test_verify_args_correct_single_source(self):
         args = self.parser.parse_args(['-n', 'destdb', '-s', 'app1'])
 
@@ -68,8 +79,200 @@ class TestCli(unittest.TestCase):
 
         error_message = cli.verify_args(args)
 
-        expected_error = ('A Heroku app destination requires a single source, one of url (-u), '
-                          'Heroku app (-s), db name (-b) or db settings (-o)')
+        expected_error = ('A Heroku app destination requires a single source, one of file (-f), '
+                          'url (-u), Heroku app (-s), db name (-b) or db settings (-o)')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_heroku_destination_file_source(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-d', 'app2'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual(None, error_message)
+
+    def test_verify_args_invalid_jobs(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb', '-j', '0'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual('Number of jobs (-j) must be at least 1', error_message)
+
+    def test_verify_args_watch(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--watch', '600'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual(None, error_message)
+
+    def test_verify_args_watch_invalid_interval(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--watch', '0'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual('Watch interval (--watch) must be at least 1 second', error_message)
+
+    def test_verify_args_watch_database_source(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb', '--watch', '600'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Watch mode (--watch) requires a Heroku app (-s) or url (-u) source'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_watch_capture(self):
+        args = self.parser.parse_args(['-s', 'app1', '-c', '-n', 'destdb', '--watch', '600'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Watch mode (--watch) cannot be combined with backup capture (-c)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_watch_status_without_watch(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--watch-status', 'w.json'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'A watch status file (--watch-status) requires watch mode (--watch)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_replicate(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb', '--replicate'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual(None, error_message)
+
+    def test_verify_args_replication_multiple_modes(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb', '--replicate',
+                                       '--stop-replication'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Only one of --replicate, --replication-lag or --stop-replication may '
+                          'be specified')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_replication_heroku_source(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--replication-lag'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Replication requires a postgres source (-b or -o) and destination '
+                          '(-n or -t)')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_profile_python_without_report(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb', '--profile-python'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Python profiling (--profile-python) requires a report file (--profile)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_plan_watch(self):
+        args = self.parser.parse_args(['-s', 'app1', '-n', 'destdb', '--watch', '60', '--plan'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Planning (--plan) cannot be combined with watch mode (--watch)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_unlogged_heroku_destination(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-d', 'app2', '--unlogged', 'keep'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Unlogged restores (--unlogged) require a postgres destination'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_aliases_require_settings(self):
+        args = self.parser.parse_args(['-o', 'source.py', '-n', 'destdb', '--aliases'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Copying aliases (--aliases) requires source (-o) and destination (-t) '
+                          'settings files, and no other locations, watch, profile or replication '
+                          'options')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_aliases_hot_tables(self):
+        args = self.parser.parse_args(['-o', 'source.py', '-t', 'dest.py', '--aliases',
+                                       '--hot-tables', 'accounts'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual('Hot tables (--hot-tables) name tables of one database and cannot be '
+                         'combined with --aliases', error_message)
+
+    def test_verify_args_alias_concurrency_without_aliases(self):
+        args = self.parser.parse_args(['-o', 'source.py', '-t', 'dest.py',
+                                       '--alias-concurrency', '2'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual('Alias concurrency (--alias-concurrency) requires --aliases',
+                         error_message)
+
+    def test_verify_args_invalid_compression(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb', '--compression', 'xz'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Compression (--compression) must be auto, none, gzip, lz4 or zstd, '
+                          'optionally with a level (e.g. zstd:3)')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_compression_file_source(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb', '--compression', 'auto'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Compression (--compression) requires a local postgres source '
+                          '(-b or -o); use --ssh-compression with --ssh')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_ssh_requires_database(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb', '--ssh', 'db1'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'An SSH source (--ssh) requires a source database (-b or -o)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_ssh_option(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb',
+                                       '--ssh=-oProxyCommand=touch x'])
+
+        error_message = cli.verify_args(args)
+
+        self.assertEqual('An SSH source (--ssh) must be a [USER@]HOST, not an option',
+                         error_message)
+
+    def test_verify_args_ssh_compression_without_ssh(self):
+        args = self.parser.parse_args(['-b', 'sourcedb', '-n', 'destdb', '--ssh-compression',
+                                       'zstd'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = 'Transport compression (--ssh-compression) requires an SSH source (--ssh)'
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_critical_path_report_file_source(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb', '--critical-path-report'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Critical path reports (--critical-path-report) require a postgres '
+                          'source (-b or -o) and destination')
+        self.assertEqual(expected_error, error_message)
+
+    def test_verify_args_hot_tables_heroku_destination(self):
+        args = self.parser.parse_args(['-f', 'db.sql', '-d', 'app2', '--hot-tables', 'accounts'])
+
+        error_message = cli.verify_args(args)
+
+        expected_error = ('Prioritized restores (--hot-tables, --ready-file, --ready-command) '
+                          'require a postgres destination')
         self.assertEqual(expected_error, error_message)
 
     @patch('argparse.ArgumentParser.exit')
@@ -96,11 +299,15 @@ class TestCli(unittest.TestCase):
 
     @patch('subprocess.check_call')
     def test_main_success(self, mock_check_call):
+        history_file = tempfile.NamedTemporaryFile(mode='r')
         sys.argv = ['paragres', '-b', 'sourcedb', '-n', 'destdb']
 
-        result = cli.main()
+        with patch('paragres.cli.DEFAULT_HISTORY_FILE', history_file.name):
+            result = cli.main()
 
         self.assertEqual(0, result)
+        run = json.loads(history_file.read())
+        self.assertEqual('db-to-postgres', run['mode'])
         expected = [
             call(['pg_dump', '-Fc', '--no-acl', '--no-owner', '--dbname=sourcedb',
                   StringStartsWith('--file=sourcedb-backup-')]),
@@ -110,3 +317,45 @@ class TestCli(unittest.TestCase):
                   StringStartsWith('sourcedb-backup-')])
         ]
         self.assertEqual(expected, mock_check_call.call_args_list)
+
+    @patch('paragres.watch.Watcher.run')
+    def test_main_watch(self, mock_watch_run):
+        sys.argv = ['paragres', '-s', 'app1', '-n', 'destdb', '--watch', '600']
+
+        result = cli.main()
+
+        self.assertEqual(0, result)
+        mock_watch_run.assert_called_once_with()
+
+    @patch('subprocess.check_call')
+    @patch('sys.stderr')
+    def test_main_command_error(self, mock_stderr, mock_check_call):
+        sys.argv = ['paragres', '-o', 'invalid_settings.py', '-n', 'destdb']
+
+        with patch('paragres.command.Command.parse_db_settings') as mock_parse:
+            mock_parse.side_effect = CommandError('Missing key or value for: NAME', 3)
+            result = cli.main()
+
+        self.assertEqual(3, result)
+        mock_stderr.write.assert_called_once_with('Missing key or value for: NAME\n')
+        self.assertEqual([], mock_check_call.call_args_list)
+
+    @patch('paragres.aliases.AliasSync.print_report')
+    @patch('paragres.aliases.AliasSync.run')
+    def test_main_aliases(self, mock_run, mock_print_report):
+        mock_run.return_value = [{'alias': 'default', 'succeeded': True},
+                                 {'alias': 'archive', 'succeeded': False}]
+        sys.argv = ['paragres', '-o', 'source.py', '-t', 'dest.py', '--aliases']
+
+        result = cli.main()
+
+        self.assertEqual(1, result)
+        mock_print_report.assert_called_once_with(mock_run.return_value)
+
+    def test_main_no_history(self):
+        sys.argv = ['paragres', '-b', 'sourcedb', '-n', 'destdb', '--no-history']
+
+        with patch('paragres.cli.Command') as mock_command:
+            cli.main()
+
+        self.assertEqual(None, mock_command.call_args[0][0].history)
@@ -0,0 +1,44 @@
+from paragres import compression
+from paragres.test import TestCase
+
+
+class TestCompression(TestCase):
+
+    def test_parse_setting(self):
+        self.assertEqual(('auto', None), compression.parse_setting('auto'))
+        self.assertEqual(('zstd', 3), compression.parse_setting('zstd:3'))
+        self.assertEqual(('gzip', None), compression.parse_setting('gzip'))
+        self.assertEqual(None, compression.parse_setting('brotli'))
+        self.assertEqual(None, compression.parse_setting('none:1'))
+        self.assertEqual(None, compression.parse_setting('zstd:'))
+
+    def test_parse_pg_dump_version(self):
+        self.assertEqual(16, compression.parse_pg_dump_version('pg_dump (PostgreSQL) 16.2\n'))
+        self.assertEqual(9, compression.parse_pg_dump_version('pg_dump (PostgreSQL) 9.6.24\n'))
+        self.assertEqual(None, compression.parse_pg_dump_version('pg_dump'))
+
+    def test_get_pg_dump_option(self):
+        self.assertEqual('--compress=0', compression.get_pg_dump_option('none', None))
+        self.assertEqual('--compress=6', compression.get_pg_dump_option('gzip', None))
+        self.assertEqual('--compress=1', compression.get_pg_dump_option('gzip', 1))
+        self.assertEqual('--compress=lz4', compression.get_pg_dump_option('lz4', None))
+        self.assertEqual('--compress=zstd:9', compression.get_pg_dump_option('zstd', 9))
+
+    def test_get_candidates(self):
+        self.assertEqual(compression.GZIP_CANDIDATES, compression.get_candidates(15))
+        self.assertTrue(('zstd', 3) in compression.get_candidates(16))
+        self.assertEqual(compression.GZIP_CANDIDATES, compression.get_candidates(None))
+
+    def test_choose_setting(self):
+        measurements = {
+            ('none', None): (1000, 1000, 0),
+            ('gzip', 6): (1000, 300, 0.5),
+            ('zstd', 3): (1000, 250, 0.01),
+        }
+
+        # A fast disk makes compression a waste of time
+        self.assertEqual(('none', None), compression.choose_setting(measurements, 1e9))
+        # A slow disk favours the cheapest good compression
+        self.assertEqual(('zstd', 3), compression.choose_setting(measurements, 1000))
+        self.assertAlmostEqual(2.6, compression.estimate_time(10000, measurements[('zstd', 3)],
+                                                              1000))
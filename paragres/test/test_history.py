@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+
+from paragres.history import (RunHistory, create_run, format_bytes, format_duration,
+                              median)
+from paragres.test import TestCase
+
+
+def create_phase(name, duration, size=None):
+    return {'phase': name, 'duration': duration, 'bytes': size}
+
+
+def create_history_run(source, duration, size, mode='url-to-postgres', succeeded=True):
+    return {
+        'source': source,
+        'mode': mode,
+        'started_at': 0,
+        'duration': duration,
+        'source_bytes': size,
+        'succeeded': succeeded,
+        'phases': [create_phase('download', duration / 2.0, size),
+                   create_phase('drop', 1),
+                   create_phase('restore', duration / 2.0 - 1, size)],
+    }
+
+
+class TestFormatting(TestCase):
+
+    def test_median(self):
+        self.assertEqual(None, median([]))
+        self.assertEqual(2, median([3, 1, 2]))
+        self.assertEqual(2.5, median([4, 1, 2, 3]))
+
+    def test_format_bytes(self):
+        self.assertEqual('unknown size', format_bytes(None))
+        self.assertEqual('512.0 B', format_bytes(512))
+        self.assertEqual('1.5 GB', format_bytes(1.5 * 1024 ** 3))
+        self.assertEqual('2.0 TB', format_bytes(2 * 1024 ** 4))
+
+    def test_format_duration(self):
+        self.assertEqual('unknown', format_duration(None))
+        self.assertEqual('42s', format_duration(42.4))
+        self.assertEqual('2m05s', format_duration(125))
+        self.assertEqual('2h05m', format_duration(2 * 3600 + 300))
+
+
+class TestRunHistory(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'paragres', 'history.jsonl')
+        self.history = RunHistory(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            os.rmdir(os.path.dirname(self.path))
+        os.rmdir(self.directory)
+
+    def test_empty(self):
+        self.assertEqual([], RunHistory(None).get_runs())
+        self.assertEqual([], self.history.get_runs())
+        self.assertEqual(None, self.history.get_throughput('download'))
+        self.assertEqual(None, self.history.get_duration('drop'))
+        self.assertEqual(None, self.history.get_ratio('unzip', 'download'))
+        self.assertEqual(None, self.history.get_last_bytes('dump', 'db:a@localhost'))
+
+    def test_append_and_reload(self):
+        run = create_history_run('url:a', 100, 1000)
+
+        self.history.append(run)
+        with open(self.path, 'a') as history_file:
+            history_file.write('{"partial": ')
+
+        self.assertEqual([run], RunHistory(self.path).get_runs())
+
+    def test_get_throughput_prefers_same_source(self):
+        self.history.append(create_history_run('url:a', 100, 1000))
+        self.history.append(create_history_run('url:b', 10, 1000))
+
+        self.assertEqual(20, self.history.get_throughput('download', 'url:a'))
+        self.assertEqual(110, self.history.get_throughput('download'))
+        self.assertEqual(110, self.history.get_throughput('download', 'url:c'))
+
+    def test_get_duration_ignores_failed_runs(self):
+        self.history.append(create_history_run('url:a', 100, 1000))
+        self.history.append(create_history_run('url:a', 10, 1000, succeeded=False))
+
+        self.assertEqual(50, self.history.get_duration('download', 'url:a'))
+
+    def test_get_ratio(self):
+        run = create_history_run('url:a', 100, 1000)
+        run['phases'].append(create_phase('unzip', 10, 4000))
+        self.history.append(run)
+
+        self.assertEqual(4, self.history.get_ratio('unzip', 'download', 'url:a'))
+
+    def test_get_last_bytes(self):
+        self.history.append(create_history_run('url:a', 100, 1000))
+        self.history.append(create_history_run('url:a', 100, 2000))
+
+        self.assertEqual(2000, self.history.get_last_bytes('download', 'url:a'))
+
+    def test_is_slow_throughput(self):
+        self.history.append(create_history_run('url:a', 100, 1000))
+        self.history.append(create_history_run('url:a', 110, 1000))
+
+        self.assertFalse(self.history.is_slow(create_history_run('url:a', 300, 2000)))
+        self.assertTrue(self.history.is_slow(create_history_run('url:a', 300, 1000)))
+        self.assertFalse(self.history.is_slow(create_history_run('url:b', 300, 1000)))
+
+    def test_is_slow_duration(self):
+        self.history.append(create_history_run('url:a', 100, None))
+
+        self.assertFalse(self.history.is_slow(create_history_run('url:a', 140, None)))
+        self.assertTrue(self.history.is_slow(create_history_run('url:a', 160, None)))
+
+    def test_create_run(self):
+        phases = [create_phase('drop', 1), create_phase('dump', 5, 3000),
+                  create_phase('restore', 9, 3000)]
+
+        run = create_run('db:a@localhost', 'db-to-postgres', 0, phases, True)
+
+        self.assertEqual(3000, run['source_bytes'])
+        self.assertTrue(run['succeeded'])
+        self.assertEqual(json.loads(json.dumps(run)), run)
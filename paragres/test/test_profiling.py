@@ -0,0 +1,117 @@
+from mock import patch
+import json
+import subprocess
+import sys
+import tempfile
+
+from paragres.cli import create_parser
+from paragres.command import Command
+from paragres.profiling import RunProfiler, get_process_name
+from paragres.test import TestCase
+
+
+class TestRunProfiler(TestCase):
+
+    def setUp(self):
+        self.report_file = tempfile.NamedTemporaryFile(mode='r')
+        self.profiler = RunProfiler(self.report_file.name)
+        self.profiler.start()
+
+    def test_get_process_name(self):
+        self.assertEqual('pg_restore', get_process_name(['pg_restore', '--no-acl']))
+        self.assertEqual('heroku pg:reset', get_process_name(['heroku', 'pg:reset', '--app=a']))
+
+    def test_check_call(self):
+        result = self.profiler.check_call([sys.executable, '-c', 'pass'])
+
+        self.assertEqual(0, result)
+        self.assertEqual(1, len(self.profiler.processes))
+        process = self.profiler.processes[0]
+        self.assertEqual(sys.executable, process['process'])
+        self.assertEqual(0, process['exit_code'])
+        self.assertTrue(process['max_rss_kb'] > 0)
+        self.assertTrue(process['wall_time'] > 0)
+
+    def test_check_call_failure(self):
+        args = [sys.executable, '-c', 'import sys; sys.exit(3)']
+
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            self.profiler.check_call(args)
+
+        self.assertEqual(3, context.exception.returncode)
+        self.assertEqual(3, self.profiler.processes[0]['exit_code'])
+
+    def test_check_output(self):
+        output = self.profiler.check_output([sys.executable, '-c', 'print("hello")'])
+
+        self.assertEqual(b'hello', output.strip())
+        self.assertEqual(1, len(self.profiler.processes))
+
+    def test_write_report(self):
+        self.profiler.check_call([sys.executable, '-c', 'pass'])
+        self.profiler.check_call([sys.executable, '-c', 'pass'])
+        self.profiler.stop()
+
+        self.profiler.write_report()
+
+        report = json.load(self.report_file)
+        self.assertEqual(2, len(report['processes']))
+        self.assertEqual(sum(process['user_time'] for process in report['processes']),
+                         report['process_totals']['user_time'])
+        self.assertTrue(report['wall_time'] >= report['process_totals']['wall_time'])
+        self.assertFalse('python_profile' in report)
+
+    def test_write_report_no_processes(self):
+        self.profiler.stop()
+
+        report = self.profiler.get_report()
+
+        self.assertEqual(0, report['process_totals']['max_rss_kb'])
+
+    def test_python_profile(self):
+        profiler = RunProfiler(self.report_file.name, profile_python=True)
+        profiler.start()
+        sorted(range(1000))
+        profiler.stop()
+
+        report = profiler.get_report()
+
+        self.assertTrue('function calls' in report['python_profile'])
+
+
+class TestCommandProfiling(TestCase):
+
+    def setUp(self):
+        self.parser = create_parser()
+        self.report_file = tempfile.NamedTemporaryFile(mode='r')
+
+    @patch('paragres.profiling.RunProfiler.check_call')
+    def test_run_profile(self, mock_check_call):
+        command = Command(self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb',
+                                                  '--profile', self.report_file.name,
+                                                  '--profile-python']))
+
+        command.run()
+
+        self.assertEqual(3, mock_check_call.call_count)
+        report = json.load(self.report_file)
+        self.assertTrue('python_profile' in report)
+
+    @patch('paragres.profiling.RunProfiler.check_output')
+    def test_check_output_profile(self, mock_check_output):
+        mock_check_output.return_value = b'42'
+        command = Command(self.parser.parse_args(['--profile', self.report_file.name]))
+
+        self.assertEqual(b'42', command.check_output(['psql']))
+        mock_check_output.assert_called_once_with(['psql'])
+
+    @patch('paragres.profiling.RunProfiler.check_call')
+    def test_run_profile_failure_still_writes_report(self, mock_check_call):
+        mock_check_call.side_effect = subprocess.CalledProcessError(1, 'dropdb')
+        command = Command(self.parser.parse_args(['-f', 'db.sql', '-n', 'destdb',
+                                                  '--profile', self.report_file.name]))
+
+        self.assertRaises(subprocess.CalledProcessError, command.run)
+
+        report = json.load(self.report_file)
+        self.assertEqual([], report['processes'])
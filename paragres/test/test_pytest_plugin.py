@@ -0,0 +1,129 @@
+from mock import call, patch
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from paragres import api, pytest_plugin
+from paragres.test import TestCase
+
+
+class FakeConfig(object):
+
+    def __init__(self, workerinput=None):
+        if workerinput is not None:
+            self.workerinput = workerinput
+
+
+class TestParseSource(TestCase):
+
+    def test_parse_source(self):
+        self.assertEqual('myapp', pytest_plugin.parse_source('heroku:myapp').heroku_app)
+        self.assertEqual('seed.dump', pytest_plugin.parse_source('file:seed.dump').file)
+        self.assertEqual('http://example.com/db',
+                         pytest_plugin.parse_source('url:http://example.com/db').url)
+        self.assertEqual('seeddb', pytest_plugin.parse_source('db:seeddb').dbname)
+
+    def test_parse_source_invalid(self):
+        self.assertRaises(pytest.UsageError, pytest_plugin.parse_source, 'seed.dump')
+        self.assertRaises(pytest.UsageError, pytest_plugin.parse_source, 'heroku:')
+
+    def test_get_worker_id(self):
+        self.assertEqual('gw3', pytest_plugin.get_worker_id(FakeConfig({'workerid': 'gw3'})))
+        self.assertEqual('main', pytest_plugin.get_worker_id(FakeConfig()))
+
+
+class TestConfigure(TestCase):
+
+    def test_worker_without_shared_dir(self):
+        config = FakeConfig({'workerid': 'gw0'})
+        config.getoption = lambda name: 'heroku:myapp' if name == 'paragres_source' else None
+        config.getini = lambda name: ''
+
+        with patch.dict(os.environ, clear=True):
+            self.assertRaises(pytest.UsageError, pytest_plugin.pytest_configure, config)
+
+
+@patch('subprocess.check_call')
+@patch('paragres.api.sync')
+@patch('paragres.api.fetch_source')
+class TestProvisioner(TestCase):
+
+    def setUp(self):
+        self.shared_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shared_dir, ignore_errors=True)
+
+    def create_provisioner(self, clone='template'):
+        return pytest_plugin.Provisioner(api.Source(heroku_app='myapp'), self.shared_dir,
+                                         prefix='ci', clone=clone, jobs=4)
+
+    def test_provision_clones_template(self, mock_fetch_source, mock_sync, mock_check_call):
+        mock_fetch_source.return_value = '/shared/myapp.dump'
+
+        name = self.create_provisioner().provision('gw0')
+
+        self.assertEqual('ci_gw0', name)
+        source, work_dir = mock_fetch_source.call_args[0]
+        self.assertEqual(('myapp', self.shared_dir), (source.heroku_app, work_dir))
+        source, destination = mock_sync.call_args[0]
+        self.assertEqual('/shared/myapp.dump', source.file)
+        self.assertEqual('ci_template', destination.dbname)
+        self.assertEqual({'jobs': 4, 'work_dir': self.shared_dir}, mock_sync.call_args[1])
+        self.assertEqual([call(['dropdb', '--if-exists', 'ci_gw0']),
+                          call(['createdb', 'ci_gw0', '--template=ci_template'])],
+                         mock_check_call.call_args_list)
+
+    def test_source_is_acquired_once(self, mock_fetch_source, mock_sync, mock_check_call):
+        mock_fetch_source.return_value = '/shared/myapp.dump'
+        names = []
+
+        def provision(worker_id):
+            names.append(self.create_provisioner().provision(worker_id))
+        threads = [threading.Thread(target=provision, args=('gw%s' % index,))
+                   for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['ci_gw0', 'ci_gw1', 'ci_gw2', 'ci_gw3'], sorted(names))
+        self.assertEqual(1, mock_fetch_source.call_count)
+        self.assertEqual(1, mock_sync.call_count)
+        self.assertEqual(8, mock_check_call.call_count)
+
+    def test_provision_restores_each_database(self, mock_fetch_source, mock_sync,
+                                              mock_check_call):
+        mock_fetch_source.return_value = '/shared/myapp.dump'
+        provisioner = self.create_provisioner(clone='restore')
+
+        provisioner.provision('gw0')
+        provisioner.provision('gw1')
+
+        self.assertEqual(1, mock_fetch_source.call_count)
+        self.assertEqual(['ci_gw0', 'ci_gw1'],
+                         [args[0][1].dbname for args in mock_sync.call_args_list])
+        self.assertEqual(['/shared/myapp.dump', '/shared/myapp.dump'],
+                         [args[0][0].file for args in mock_sync.call_args_list])
+        self.assertEqual(0, mock_check_call.call_count)
+
+    def test_cleanup(self, mock_fetch_source, mock_sync, mock_check_call):
+        mock_fetch_source.return_value = '/shared/myapp.dump'
+        provisioner = self.create_provisioner()
+        provisioner.provision('gw0')
+        provisioner.drop('ci_gw0')
+        mock_check_call.reset_mock()
+
+        provisioner.cleanup()
+
+        mock_check_call.assert_called_once_with(['dropdb', '--if-exists', 'ci_template'])
+        self.assertFalse(os.path.exists(self.shared_dir))
+
+    def test_cleanup_before_provisioning(self, mock_fetch_source, mock_sync, mock_check_call):
+        self.create_provisioner().cleanup()
+
+        self.assertEqual(0, mock_check_call.call_count)
+        self.assertFalse(os.path.exists(self.shared_dir))
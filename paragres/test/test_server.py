@@ -0,0 +1,270 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from paragres import server
+from paragres.command import CommandError
+from paragres.test import TestCase
+
+try:
+    # Python 3
+    from urllib import request as urllib2
+    from urllib.error import HTTPError
+except ImportError:
+    # Python 2
+    import urllib2
+    from urllib2 import HTTPError
+
+
+class RecordingSync(object):
+    """ Stands in for api.sync, optionally holding each call until released. """
+
+    def __init__(self, hold=False):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, source, destination, **options):
+        with self.lock:
+            self.calls.append((source.__dict__, destination.__dict__, options))
+        self.release.wait(10)
+        if destination.dbname == 'broken':
+            raise CommandError('restore failed')
+
+
+class TestJobQueue(TestCase):
+
+    def setUp(self):
+        self.sync = RecordingSync()
+        self.queue = server.JobQueue(workers=2, sync=self.sync)
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def wait_for(self, condition):
+        deadline = time.time() + 10
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_submit_merges_identical_requests(self):
+        first = self.queue.submit({'url': 'http://example.com/db'}, {'dbname': 'ci_1'})
+        second = self.queue.submit({'url': 'http://example.com/db'}, {'dbname': 'ci_1'})
+        other = self.queue.submit({'url': 'http://example.com/db'}, {'dbname': 'ci_2'})
+
+        self.assertTrue(first is second)
+        self.assertEqual(2, first.requests)
+        self.assertEqual(['1', '2'], [first.id, other.id])
+        self.assertEqual(1, self.queue.get_metrics()['merged_requests'])
+
+    def test_submit_invalid(self):
+        self.assertRaises(TypeError, self.queue.submit, {'path': 'db.dump'}, {'dbname': 'ci'})
+        self.assertRaises(TypeError, self.queue.submit, {'file': 'db.dump'}, {'dbname': 'ci'},
+                          {'threads': 4})
+        self.assertRaises(TypeError, self.queue.submit, {'file': 'db.dump'}, {'dbname': 'ci'},
+                          {'ready_command': 'touch /tmp/pwned'})
+        self.assertRaises(TypeError, self.queue.submit, {'file': 'db.dump'}, {'dbname': 'ci'},
+                          {'jobs': 2, 'profile': '/etc/anything'})
+        self.assertRaises(CommandError, self.queue.submit, {'file': 'db.dump'}, {})
+        self.assertEqual([], self.queue.jobs)
+
+    def test_next_job_respects_limits(self):
+        self.queue.per_source = 1
+        first = self.queue.submit({'file': 'a.dump'}, {'dbname': 'ci_1'})
+        second = self.queue.submit({'file': 'a.dump'}, {'dbname': 'ci_2'})
+        third = self.queue.submit({'file': 'b.dump'}, {'dbname': 'ci_1'})
+        fourth = self.queue.submit({'file': 'b.dump'}, {'dbname': 'ci_3'})
+
+        self.assertTrue(self.queue.next_job() is first)
+        first.status = 'running'
+        # second shares first's source, third its destination
+        self.assertTrue(self.queue.next_job() is fourth)
+        first.status = 'succeeded'
+        self.assertTrue(self.queue.next_job() is second)
+        self.assertTrue(third.status == 'queued')
+
+    def test_run_jobs(self):
+        self.queue.start()
+        good = self.queue.submit({'file': 'a.dump'}, {'dbname': 'ci_1'}, {'jobs': 2})
+        bad = self.queue.submit({'file': 'a.dump'}, {'dbname': 'broken'})
+
+        self.queue.wait(good, timeout=10)
+        self.queue.wait(bad, timeout=10)
+
+        self.assertEqual('succeeded', good.status)
+        self.assertEqual('failed', bad.status)
+        self.assertEqual('restore failed', bad.error)
+        good_call = [call for call in self.sync.calls if call[1]['dbname'] == 'ci_1'][0]
+        self.assertEqual(('a.dump', {'jobs': 2}), (good_call[0]['file'], good_call[2]))
+        metrics = self.queue.get_metrics()
+        self.assertEqual({'succeeded': 1, 'failed': 1}, metrics['jobs'])
+        self.assertEqual(2, metrics['requests'])
+
+    def test_sources_fetched_into_separate_directories(self):
+        directories = []
+
+        def fetch(job, directory):
+            directories.append(directory)
+            dump_file = os.path.join(directory, 'bucket_s3_amazonaws_com-backup.sql')
+            open(dump_file, 'w').close()
+            return dump_file
+        self.queue.sources.fetch = fetch
+        jobs = [server.Job(str(index), {'url': 'https://bucket.s3.amazonaws.com/%s.dump' % name},
+                           {'dbname': 'ci_%s' % index}, {})
+                for index, name in enumerate(['a', 'b'])]
+
+        files = [self.queue.sources.acquire(job) for job in jobs]
+
+        self.assertNotEqual(files[0], files[1])
+        self.queue.sources.release(jobs[0])
+        self.assertFalse(os.path.exists(directories[0]))
+        self.assertTrue(os.path.exists(files[1]))
+        self.queue.sources.release(jobs[1])
+
+    def test_finished_jobs_are_pruned(self):
+        self.queue.keep_finished = 2
+        self.queue.start()
+        jobs = [self.queue.submit({'file': 'a.dump'}, {'dbname': 'ci_%s' % index})
+                for index in range(4)]
+        for job in jobs:
+            self.queue.wait(job, timeout=10)
+
+        self.assertEqual(2, len(self.queue.jobs))
+        self.assertEqual(None, self.queue.get(jobs[0].id))
+        self.assertEqual({'succeeded': 2}, self.queue.get_metrics()['jobs'])
+
+    def test_shared_source(self):
+        self.queue.sync = self.sync = RecordingSync(hold=True)
+        fetched = []
+
+        def fetch(job, directory):
+            dump_file = os.path.join(directory, 'shared.dump')
+            open(dump_file, 'w').close()
+            fetched.append(job.id)
+            return dump_file
+        self.queue.sources.fetch = fetch
+        self.queue.start()
+        source = {'heroku_app': 'app1', 'capture': True}
+        jobs = [self.queue.submit(source, {'dbname': 'ci_%s' % index}) for index in range(2)]
+
+        self.wait_for(lambda: len(self.sync.calls) == 2)
+        self.sync.release.set()
+        for job in jobs:
+            self.queue.wait(job, timeout=10)
+
+        self.assertEqual(['1'], fetched)
+        self.assertEqual([False, True], sorted(job.shared_source for job in jobs))
+        dump_file = self.sync.calls[0][0]['file']
+        self.assertEqual(self.queue.work_dir, os.path.dirname(os.path.dirname(dump_file)))
+        self.assertEqual([dump_file, dump_file], [call[0]['file'] for call in self.sync.calls])
+        self.assertFalse(os.path.exists(os.path.dirname(dump_file)))
+        metrics = self.queue.get_metrics()
+        self.assertEqual((1, 1), (metrics['source_fetches'], metrics['shared_sources']))
+
+    def test_shared_source_restores_without_fetch_options(self):
+        self.queue.sources.fetch = lambda job, directory: 'shared.dump'
+        self.queue.sources.release = lambda job: None
+        job = self.queue.submit({'heroku_app': 'app1'}, {'dbname': 'ci_1'},
+                                {'use_pgbackups': True, 'jobs': 2})
+
+        self.queue.run_job(job)
+
+        self.assertEqual([({'file': 'shared.dump'}, {'jobs': 2})],
+                         [(dict((name, value) for name, value in source.items() if value),
+                           options) for source, destination, options in self.sync.calls])
+
+    def test_source_key_includes_fetch_options(self):
+        local = server.Job('1', {'dbname': 'src'}, {'dbname': 'ci_1'}, {'jobs': 2})
+        over_ssh = server.Job('2', {'dbname': 'src'}, {'dbname': 'ci_2'}, {'ssh': 'hostA'})
+        other = server.Job('3', {'dbname': 'src'}, {'dbname': 'ci_3'}, {'unlogged': 'keep'})
+
+        self.assertNotEqual(local.source_key, over_ssh.source_key)
+        self.assertEqual(local.source_key, other.source_key)
+
+    def test_heroku_destination_not_shared(self):
+        job = server.Job('1', {'url': 'http://example.com/db'}, {'heroku_app': 'app2'}, {})
+
+        self.assertFalse(job.is_shareable())
+        self.assertFalse(server.Job('1', {'file': 'a.dump'}, {'dbname': 'ci'}, {}).is_shareable())
+        self.assertTrue(server.Job('1', {'dbname': 'src'}, {'dbname': 'ci'}, {}).is_shareable())
+        self.assertFalse(server.Job('1', {'dbname': 'src'}, {'dbname': 'ci'},
+                                    {'critical_path_report': True}).is_shareable())
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.sync = RecordingSync()
+        self.queue = server.JobQueue(workers=1, sync=self.sync)
+        self.queue.start()
+
+    def tearDown(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.queue.stop()
+
+    def serve(self, **kwargs):
+        self.http_server = server.create_server(self.queue, **kwargs)
+        thread = threading.Thread(target=self.http_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def request(self, path, body=None):
+        url = 'http://127.0.0.1:%s%s' % (self.http_server.server_address[1], path)
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        try:
+            response = urllib2.urlopen(urllib2.Request(url, data=data))
+        except HTTPError as e:
+            return e.code, json.loads(e.read().decode('utf-8'))
+        return response.getcode(), json.loads(response.read().decode('utf-8'))
+
+    def test_http(self):
+        self.serve(port=0)
+
+        status, job = self.request('/jobs', {'source': {'file': 'a.dump'},
+                                             'destination': {'dbname': 'ci_1'}})
+        self.assertEqual((202, '1'), (status, job['id']))
+        self.queue.wait(self.queue.get('1'), timeout=10)
+
+        self.assertEqual('succeeded', self.request('/jobs/1')[1]['status'])
+        self.assertEqual(['1'], [job['id'] for job in self.request('/jobs')[1]])
+        self.assertEqual({'succeeded': 1}, self.request('/metrics')[1]['jobs'])
+        self.assertEqual(404, self.request('/jobs/2')[0])
+        status, error = self.request('/jobs', {'source': {'file': 'a.dump'},
+                                               'destination': {'dbname': 'ci_1'},
+                                               'options': {'threads': 2}})
+        self.assertEqual((400, "Option 'threads' is not allowed"), (status, error['error']))
+        status, error = self.request('/jobs', {'source': {'dbname': 'src'},
+                                               'destination': {'dbname': 'ci_1'},
+                                               'options': {'ssh': '-oProxyCommand=touch x'}})
+        self.assertEqual((400, "Option 'ssh' is not allowed"), (status, error['error']))
+        status, error = self.request('/jobs', {'source': {'file': 'a.dump'},
+                                               'destination': {'dbname': 'ci_1'},
+                                               'options': {'ready_command': 'touch /tmp/x'}})
+        self.assertEqual((400, "Option 'ready_command' is not allowed"),
+                         (status, error['error']))
+
+    def test_unix_socket(self):
+        socket_path = os.path.join(tempfile.mkdtemp(), 'paragres.sock')
+        self.serve(socket_path=socket_path)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = b''
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+        client.close()
+
+        headers, body = response.split(b'\r\n\r\n', 1)
+        self.assertTrue(headers.startswith(b'HTTP/1.0 200'))
+        self.assertEqual(0, json.loads(body.decode('utf-8'))['requests'])
+        os.remove(socket_path)
+        os.rmdir(os.path.dirname(socket_path))
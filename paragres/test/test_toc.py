@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+from paragres import toc
+from paragres.test import TestCase
+
+LISTING = """;
+; Archive created at 2026-10-19 05:00:00 UTC
+;     dbname: source
+;
+; Selected TOC Entries:
+;
+3345; 0 16386 TABLE DATA public accounts postgres
+3346; 0 16390 TABLE DATA public events postgres
+3347; 0 16395 TABLE DATA public Big Table postgres
+3350; 0 0 SEQUENCE SET public accounts_id_seq postgres
+3200; 2606 16393 CONSTRAINT public accounts accounts_pkey postgres
+3201; 1259 16394 INDEX public accounts_name_idx postgres
+3202; 1259 16396 INDEX public events_created_idx postgres
+3203; 2606 16400 FK CONSTRAINT public events events_account_id_fkey postgres
+3204; 2620 16401 TRIGGER public accounts accounts_audit postgres
+"""
+
+POST_DATA_SQL = """
+CREATE INDEX accounts_name_idx ON public.accounts USING btree (name);
+
+CREATE UNIQUE INDEX events_created_idx ON ONLY public.events USING btree (created);
+
+CREATE INDEX "Mixed_idx" ON "Other"."Mixed" USING btree (id);
+"""
+
+
+class TestToc(TestCase):
+
+    def test_parse_toc(self):
+        entries = toc.parse_toc(LISTING)
+
+        self.assertEqual(9, len(entries))
+        self.assertEqual((3345, 'TABLE DATA', 'public', 'accounts', 'postgres'),
+                         (entries[0].dump_id, entries[0].desc, entries[0].schema,
+                          entries[0].tag, entries[0].owner))
+        self.assertEqual('Big Table', entries[2].tag)
+        self.assertEqual('SEQUENCE SET', entries[3].desc)
+        self.assertEqual('FK CONSTRAINT', entries[7].desc)
+        self.assertEqual('events events_account_id_fkey', entries[7].tag)
+
+    def test_parse_index_tables(self):
+        expected = {
+            ('public', 'accounts_name_idx'): 'accounts',
+            ('public', 'events_created_idx'): 'events',
+            ('Other', 'Mixed_idx'): 'Mixed',
+        }
+        self.assertEqual(expected, toc.parse_index_tables(POST_DATA_SQL))
+
+    def test_get_table(self):
+        entries = toc.parse_toc(LISTING)
+        index_tables = toc.parse_index_tables(POST_DATA_SQL)
+
+        tables = [entry.get_table(index_tables) for entry in entries]
+
+        self.assertEqual(['accounts', 'events', 'Big Table', None, 'accounts', 'accounts',
+                          'events', 'events', 'accounts'], tables)
+        self.assertTrue(entries[0].is_for_tables(['public.accounts'], index_tables))
+        self.assertFalse(entries[0].is_for_tables(['other.accounts'], index_tables))
+
+    def test_split_priority(self):
+        entries = toc.parse_toc(LISTING)
+        data, post_data = entries[:4], entries[4:]
+
+        hot_data, hot_post_data, cold_data, cold_post_data = toc.split_priority(
+            data, post_data, ['accounts', 'public.events'], toc.parse_index_tables(POST_DATA_SQL))
+
+        self.assertEqual([3345, 3346, 3350], [entry.dump_id for entry in hot_data])
+        self.assertEqual([3200, 3201, 3202, 3204], [entry.dump_id for entry in hot_post_data])
+        self.assertEqual([3347], [entry.dump_id for entry in cold_data])
+        self.assertEqual([3203], [entry.dump_id for entry in cold_post_data])
+
+    def test_write_toc(self):
+        entries = toc.parse_toc(LISTING)[:2]
+        list_file, filename = tempfile.mkstemp()
+        os.close(list_file)
+
+        toc.write_toc(entries, filename)
+
+        with open(filename) as result:
+            self.assertEqual('3345; 0 16386 TABLE DATA public accounts postgres\n'
+                             '3346; 0 16390 TABLE DATA public events postgres\n', result.read())
+        os.remove(filename)
+
+
+class TestSchedule(TestCase):
+
+    def setUp(self):
+        self.entries = toc.parse_toc(
+            "3345; 0 16386 TABLE DATA public accounts postgres\n"
+            "3346; 0 16390 TABLE DATA public events postgres\n"
+            "3347; 0 16395 TABLE DATA public logs postgres\n"
+            "3350; 0 0 SEQUENCE SET public accounts_id_seq postgres\n"
+            "3200; 2606 16393 CONSTRAINT public accounts accounts_pkey postgres\n"
+            "3201; 2606 16394 CONSTRAINT public events events_pkey postgres\n"
+            "3202; 1259 16396 INDEX public events_created_idx postgres\n"
+            "3203; 2606 16400 FK CONSTRAINT public events events_account_id_fkey postgres\n")
+        self.sizes = toc.parse_relation_sizes(
+            "public|accounts|100\npublic|events|100\npublic|logs|500\n"
+            "public|accounts_pkey|10\npublic|events_pkey|50\npublic|events_created_idx|70\n")
+
+    def test_parse_relation_sizes(self):
+        self.assertEqual(6, len(self.sizes))
+        self.assertEqual(500, self.sizes[('public', 'logs')])
+        self.assertEqual({('a', 'b|c'): 1}, toc.parse_relation_sizes('a|b|c|1\n\n'))
+
+    def test_get_entry_size(self):
+        self.assertEqual([100, 100, 500, 0, 10, 50, 70, 0],
+                         [toc.get_entry_size(entry, self.sizes) for entry in self.entries])
+
+    def test_simulate_schedule(self):
+        data = self.entries[:3]
+
+        self.assertEqual((600, [data[0], data[2]]), toc.simulate_schedule(data, self.sizes, 2))
+        self.assertEqual((700, data), toc.simulate_schedule(data, self.sizes, 1))
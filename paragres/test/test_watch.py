@@ -0,0 +1,203 @@
+from mock import MagicMock, patch
+import json
+import os
+import subprocess
+import tempfile
+
+from paragres.cli import create_parser
+from paragres.command import Command
+from paragres.test import TestCase
+from paragres.watch import Watcher
+
+try:
+    # Python 3
+    from urllib.request import HTTPError
+    urllib_patch_string = 'urllib.request.urlopen'
+except ImportError:
+    # Python 2
+    from urllib2 import HTTPError
+    urllib_patch_string = 'urllib2.urlopen'
+
+
+class TestWatcher(TestCase):
+
+    def setUp(self):
+        self.parser = create_parser()
+        self.sleep = MagicMock()
+
+    def create_watcher(self, args, status_file=None):
+        command = Command(self.parser.parse_args(args + ['-v', '0']))
+        command.run = MagicMock()
+        return Watcher(command, 60, status_file=status_file, sleep=self.sleep)
+
+    @patch(urllib_patch_string)
+    def test_get_url_version(self, mock_urlopen):
+        mock_urlopen.return_value.headers = {'ETag': '"abc"'}
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        version = watcher.get_url_version('http://example.com/db.dump')
+
+        self.assertEqual('"abc"', version)
+        self.assertEqual('"abc"', watcher.etag)
+        request = mock_urlopen.call_args[0][0]
+        self.assertEqual('HEAD', request.get_method())
+        self.assertEqual(None, request.get_header('If-none-match'))
+
+    @patch(urllib_patch_string)
+    def test_get_url_version_last_modified(self, mock_urlopen):
+        mock_urlopen.return_value.headers = {'Last-Modified': 'Tue, 04 Jun 2019 15:00:20 GMT'}
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        version = watcher.get_url_version('http://example.com/db.dump')
+
+        self.assertEqual('Tue, 04 Jun 2019 15:00:20 GMT', version)
+
+    @patch(urllib_patch_string)
+    def test_get_url_version_content_length(self, mock_urlopen):
+        mock_urlopen.return_value.headers = {'Content-Length': '1234'}
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        with patch('paragres.command.Command.print_message') as mock_print_message:
+            versions = [watcher.get_url_version('http://example.com/db.dump') for _ in range(2)]
+
+        self.assertEqual(['length:1234', 'length:1234'], versions)
+        mock_print_message.assert_called_once_with(
+            "WARNING: 'http://example.com/db.dump' has no ETag or Last-Modified header, so new "
+            "backups are only detected when their size changes", verbosity_needed=0)
+
+    @patch(urllib_patch_string)
+    def test_get_url_version_no_headers(self, mock_urlopen):
+        mock_urlopen.return_value.headers = {}
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        with patch('paragres.command.Command.print_message') as mock_print_message:
+            version = watcher.get_url_version('http://example.com/db.dump')
+
+        self.assertEqual(None, version)
+        mock_print_message.assert_called_once_with(
+            "WARNING: 'http://example.com/db.dump' has no ETag, Last-Modified or Content-Length "
+            "header, so new backups cannot be detected", verbosity_needed=0)
+
+    @patch(urllib_patch_string)
+    def test_get_url_version_not_modified(self, mock_urlopen):
+        mock_urlopen.side_effect = HTTPError('http://example.com/', 304, 'Not Modified', {}, None)
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+        watcher.etag = '"abc"'
+
+        version = watcher.get_url_version('http://example.com/db.dump')
+
+        self.assertEqual('"abc"', version)
+        request = mock_urlopen.call_args[0][0]
+        self.assertEqual('"abc"', request.get_header('If-none-match'))
+
+    @patch(urllib_patch_string)
+    def test_get_url_version_error(self, mock_urlopen):
+        mock_urlopen.side_effect = HTTPError('http://example.com/', 500, 'Error', {}, None)
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        self.assertRaises(HTTPError, watcher.get_url_version, 'http://example.com/db.dump')
+
+    @patch('paragres.command.Command.get_latest_heroku_backup')
+    def test_get_source_version_heroku(self, mock_latest_backup):
+        mock_latest_backup.return_value = {'id': 'b005', 'finished': 1559660420}
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+
+        self.assertEqual('b005', watcher.get_source_version())
+        mock_latest_backup.assert_called_once_with('app1')
+
+    @patch('paragres.command.Command.get_latest_heroku_backup')
+    def test_get_source_version_heroku_no_backup(self, mock_latest_backup):
+        mock_latest_backup.return_value = None
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+
+        self.assertEqual(None, watcher.get_source_version())
+
+    @patch('paragres.watch.Watcher.get_url_version')
+    def test_get_source_version_url(self, mock_url_version):
+        mock_url_version.return_value = '"abc"'
+        watcher = self.create_watcher(['-u', 'http://example.com/db.dump', '-n', 'destdb'])
+
+        self.assertEqual('"abc"', watcher.get_source_version())
+        mock_url_version.assert_called_once_with('http://example.com/db.dump')
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_run_syncs_only_new_versions(self, mock_source_version):
+        mock_source_version.side_effect = ['b005', 'b005', 'b006']
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+
+        watcher.run(max_checks=3)
+
+        self.assertEqual(2, watcher.command.run.call_count)
+        self.assertEqual(2, self.sleep.call_count)
+        self.assertEqual(3, watcher.status['checks'])
+        self.assertEqual(2, watcher.status['syncs'])
+        self.assertEqual('b006', watcher.status['last_sync_version'])
+        self.assertTrue(watcher.status['healthy'])
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_poll_no_backup(self, mock_source_version):
+        mock_source_version.return_value = None
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+
+        self.assertEqual(60, watcher.poll())
+        self.assertEqual(0, watcher.command.run.call_count)
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_poll_check_failure_backs_off(self, mock_source_version):
+        mock_source_version.side_effect = Exception('Network down')
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+
+        self.assertEqual(120, watcher.poll())
+        self.assertEqual(240, watcher.poll())
+        watcher.status['consecutive_failures'] = 10
+        self.assertEqual(3600, watcher.get_delay())
+        self.assertFalse(watcher.status['healthy'])
+        self.assertEqual('Network down', watcher.status['last_error'])
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_poll_sync_failure_retries(self, mock_source_version):
+        mock_source_version.return_value = 'b005'
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'])
+        watcher.command.run.side_effect = [subprocess.CalledProcessError(1, 'pg_restore'), None]
+
+        self.assertEqual(120, watcher.poll())
+        self.assertEqual(None, watcher.synced_version)
+        self.assertEqual(1, watcher.status['sync_failures'])
+
+        self.assertEqual(60, watcher.poll())
+        self.assertEqual('b005', watcher.synced_version)
+        self.assertTrue(watcher.status['healthy'])
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_poll_writes_status_file(self, mock_source_version):
+        mock_source_version.return_value = 'b005'
+        status_dir = tempfile.mkdtemp()
+        status_file = os.path.join(status_dir, 'status.json')
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'], status_file=status_file)
+
+        watcher.poll()
+
+        with open(status_file) as status:
+            result = json.load(status)
+        os.remove(status_file)
+        os.rmdir(status_dir)
+        self.assertEqual('waiting', result['state'])
+        self.assertEqual('b005', result['last_sync_version'])
+        self.assertEqual(1, result['syncs'])
+
+    @patch('paragres.watch.Watcher.get_source_version')
+    def test_restart_does_not_sync_synced_version(self, mock_source_version):
+        mock_source_version.return_value = 'b005'
+        status_dir = tempfile.mkdtemp()
+        status_file = os.path.join(status_dir, 'status.json')
+        self.create_watcher(['-s', 'app1', '-n', 'destdb'], status_file=status_file).poll()
+
+        watcher = self.create_watcher(['-s', 'app1', '-n', 'destdb'], status_file=status_file)
+        watcher.poll()
+
+        os.remove(status_file)
+        os.rmdir(status_dir)
+        self.assertEqual('b005', watcher.synced_version)
+        self.assertEqual(0, watcher.command.run.call_count)
+        self.assertEqual(1, watcher.status['syncs'])
+        self.assertEqual(1, watcher.status['checks'])
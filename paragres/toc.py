@@ -0,0 +1,155 @@
+import re
+
+# Archive item types which are more than one word, longest first
+MULTI_WORD_DESCS = [
+    'MATERIALIZED VIEW DATA',
+    'SEQUENCE OWNED BY',
+    'MATERIALIZED VIEW',
+    'STATISTICS DATA',
+    'FK CONSTRAINT',
+    'EVENT TRIGGER',
+    'INDEX ATTACH',
+    'LARGE OBJECT',
+    'SEQUENCE SET',
+    'TABLE ATTACH',
+    'DEFAULT ACL',
+    'TABLE DATA',
+]
+
+# Items whose tag is '<table> <name>'
+TABLE_PREFIXED_DESCS = ['CONSTRAINT', 'FK CONSTRAINT', 'TRIGGER', 'POLICY']
+
+TOC_LINE_PATTERN = re.compile(r'^(\d+); (\d+) (\d+) (.*)$')
+
+INDEX_PATTERN = re.compile(r'^CREATE (?:UNIQUE )?INDEX (\S+) ON (?:ONLY )?(\S+)', re.MULTILINE)
+
+
+class TocEntry(object):
+    """ One item of a pg_restore archive listing (pg_restore -l). """
+
+    def __init__(self, line, dump_id, desc, schema, tag, owner):
+        self.line = line
+        self.dump_id = dump_id
+        self.desc = desc
+        self.schema = schema
+        self.tag = tag
+        self.owner = owner
+
+    def get_table(self, index_tables):
+        """ Name of the table the item belongs to, or None. index_tables maps
+        (schema, index) to table, since index items don't name their table. """
+        if self.desc in ['TABLE', 'TABLE DATA']:
+            return self.tag
+        if self.desc in TABLE_PREFIXED_DESCS:
+            return self.tag.split(' ')[0]
+        if self.desc == 'INDEX':
+            return index_tables.get((self.schema, self.tag))
+        return None
+
+    def is_for_tables(self, tables, index_tables):
+        """ Whether the item belongs to one of tables, which may be schema qualified. """
+        table = self.get_table(index_tables)
+        if table is None:
+            return False
+        return table in tables or '%s.%s' % (self.schema, table) in tables
+
+
+def parse_toc_line(line):
+    """ Parse a listing line such as '3345; 0 16386 TABLE DATA public accounts postgres',
+    or return None for comments. """
+    match = TOC_LINE_PATTERN.match(line.strip())
+    if not match:
+        return None
+    rest = match.group(4)
+    desc = rest.split(' ')[0]
+    for multi_word_desc in MULTI_WORD_DESCS:
+        if rest.startswith(multi_word_desc + ' '):
+            desc = multi_word_desc
+            break
+    words = rest[len(desc) + 1:].split(' ')
+    return TocEntry(line.rstrip('\n'), int(match.group(1)), desc, words[0],
+                    ' '.join(words[1:-1]), words[-1])
+
+
+def parse_toc(listing):
+    entries = []
+    for line in listing.splitlines():
+        entry = parse_toc_line(line)
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+def write_toc(entries, filename):
+    """ Write entries as a list file for pg_restore --use-list. """
+    with open(filename, 'w') as output:
+        for entry in entries:
+            output.write('%s\n' % entry.line)
+
+
+def unquote(name):
+    return name.replace('"', '')
+
+
+def parse_index_tables(sql):
+    """ Map (schema, index) to table name from post-data SQL (pg_restore --section=post-data). """
+    index_tables = {}
+    for index, table in INDEX_PATTERN.findall(sql):
+        schema, _, table = unquote(table).rpartition('.')
+        index_tables[(schema, unquote(index))] = table
+    return index_tables
+
+
+def split_priority(data_entries, post_data_entries, tables, index_tables):
+    """ Split data and post-data items into those needed to use the given (hot) tables and
+    the rest. Sequence values are restored with the hot tables so new rows get fresh ids.
+    Foreign keys wait for the rest, since they may reference tables not yet loaded. """
+    hot_data = []
+    cold_data = []
+    for entry in data_entries:
+        if entry.desc == 'SEQUENCE SET' or entry.is_for_tables(tables, index_tables):
+            hot_data.append(entry)
+        else:
+            cold_data.append(entry)
+    hot_post_data = []
+    cold_post_data = []
+    for entry in post_data_entries:
+        if entry.desc != 'FK CONSTRAINT' and entry.is_for_tables(tables, index_tables):
+            hot_post_data.append(entry)
+        else:
+            cold_post_data.append(entry)
+    return hot_data, hot_post_data, cold_data, cold_post_data
+
+
+def parse_relation_sizes(output):
+    """ Map (schema, relation) to bytes from 'schema|name|bytes' rows (psql --no-align). """
+    sizes = {}
+    for line in output.splitlines():
+        parts = line.split('|')
+        if len(parts) >= 3:
+            sizes[(parts[0], '|'.join(parts[1:-1]))] = int(parts[-1])
+    return sizes
+
+
+def get_entry_size(entry, sizes):
+    """ Bytes of the table or index an item creates, or 0 if unknown. Unique and primary
+    key constraints are sized by their index, which has the constraint's name. """
+    name = entry.tag
+    if entry.desc == 'CONSTRAINT':
+        name = entry.tag.split(' ', 1)[-1]
+    return sizes.get((entry.schema, name), 0)
+
+
+def simulate_schedule(entries, sizes, jobs):
+    """ Predict a parallel restore, with each item going to the first free job and taking
+    time in proportion to its size. pg_dump writes table data and indexes largest first, and
+    parallel pg_restore also starts the largest ready items first, so archive order is a good
+    approximation. Returns the size of the longest job and its items. """
+    loads = [0] * max(jobs, 1)
+    assigned = [[] for _ in loads]
+    for entry in entries:
+        job = loads.index(min(loads))
+        loads[job] += get_entry_size(entry, sizes)
+        assigned[job].append(entry)
+    longest = loads.index(max(loads))
+    return loads[longest], assigned[longest]
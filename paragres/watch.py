@@ -0,0 +1,177 @@
+import json
+import os
+import time
+try:
+    # Python 3
+    from urllib import request as urllib2
+except ImportError:
+    # Python 2
+    import urllib2
+
+
+class HeadRequest(urllib2.Request):
+    def get_method(self):
+        return 'HEAD'
+
+
+class Watcher(object):
+    """ Poll a Heroku app or URL source and run a sync whenever a new backup appears. """
+    max_backoff = 3600
+
+    def __init__(self, command, interval, status_file=None, sleep=time.sleep):
+        self.command = command
+        self.interval = interval
+        self.status_file = status_file
+        self.sleep = sleep
+        self.etag = None
+        self.warned_version_header = None
+        self.synced_version = None
+        self.status = {
+            'healthy': True,
+            'state': 'starting',
+            'started_at': time.time(),
+            'checks': 0,
+            'consecutive_failures': 0,
+            'last_check_at': None,
+            'last_error': None,
+            'source_version': None,
+            'syncs': 0,
+            'sync_failures': 0,
+            'last_sync_at': None,
+            'last_sync_duration': None,
+            'last_sync_version': None,
+        }
+        self.read_status()
+
+    def read_status(self):
+        """ Carry on from the sync recorded in an existing status file, so that restarting the
+        watch does not copy a backup which has already been synced. """
+        if not self.status_file or not os.path.exists(self.status_file):
+            return
+        try:
+            with open(self.status_file) as status_file:
+                status = json.load(status_file)
+        except (IOError, ValueError) as e:
+            self.command.print_message("Ignoring unreadable status file '%s': %s"
+                                       % (self.status_file, e), verbosity_needed=0)
+            return
+        for key in ['syncs', 'sync_failures', 'last_sync_at', 'last_sync_duration',
+                    'last_sync_version']:
+            if key in status:
+                self.status[key] = status[key]
+        self.synced_version = self.status['last_sync_version']
+
+    def warn_version_header(self, message):
+        if self.warned_version_header != message:
+            self.warned_version_header = message
+            self.command.print_message("WARNING: %s" % message, verbosity_needed=0)
+
+    def get_url_version(self, url):
+        """ Get the ETag (or Last-Modified) of url with a conditional HEAD request. Without
+        either, the Content-Length is used, which misses new backups of the same size. """
+        request = HeadRequest(url)
+        if self.etag:
+            request.add_header('If-None-Match', self.etag)
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            if e.code == 304:
+                return self.etag
+            raise
+        try:
+            headers = response.headers
+            version = headers.get('ETag') or headers.get('Last-Modified')
+        finally:
+            response.close()
+        self.etag = headers.get('ETag')
+        if not version and headers.get('Content-Length'):
+            self.warn_version_header("'%s' has no ETag or Last-Modified header, so new backups "
+                                     "are only detected when their size changes" % url)
+            version = 'length:%s' % headers.get('Content-Length')
+        elif not version:
+            self.warn_version_header("'%s' has no ETag, Last-Modified or Content-Length "
+                                     "header, so new backups cannot be detected" % url)
+        return version
+
+    def get_source_version(self):
+        """ Get an identifier which changes whenever the source has a new backup. """
+        args = self.command.args
+        if args.source_app:
+            backup = self.command.get_latest_heroku_backup(args.source_app)
+            return backup['id'] if backup else None
+        return self.get_url_version(args.url)
+
+    def write_status(self):
+        """ Write health and sync metrics to the status file, if one was specified. """
+        if not self.status_file:
+            return
+        temp_file = '%s.tmp' % self.status_file
+        with open(temp_file, 'w') as output:
+            json.dump(self.status, output, indent=2, sort_keys=True)
+        # Readers never see a partially written file
+        os.rename(temp_file, self.status_file)
+
+    def record_failure(self, error):
+        self.status['consecutive_failures'] += 1
+        self.status['healthy'] = False
+        self.status['last_error'] = str(error)
+        self.command.print_message("Watch error: %s" % error)
+
+    def get_delay(self):
+        """ Seconds to wait before the next check, backing off after consecutive failures. """
+        failures = self.status['consecutive_failures']
+        if not failures:
+            return self.interval
+        return min(self.interval * 2 ** failures, max(self.max_backoff, self.interval))
+
+    def sync(self, version):
+        """ Run a sync for the given source version. """
+        self.command.print_message("New backup '%s' detected, syncing" % version)
+        self.status['state'] = 'syncing'
+        self.write_status()
+        start = time.time()
+        try:
+            self.command.run()
+        except Exception as e:
+            self.status['sync_failures'] += 1
+            self.record_failure(e)
+            return
+        self.synced_version = version
+        self.status['syncs'] += 1
+        self.status['last_sync_at'] = time.time()
+        self.status['last_sync_duration'] = self.status['last_sync_at'] - start
+        self.status['last_sync_version'] = version
+        self.status['consecutive_failures'] = 0
+        self.status['healthy'] = True
+
+    def poll(self):
+        """ Check the source once, syncing if it has changed, and return the delay until the
+        next check. Backups which appear during a sync are coalesced into the next check. """
+        self.status['state'] = 'checking'
+        self.status['checks'] += 1
+        self.status['last_check_at'] = time.time()
+        try:
+            version = self.get_source_version()
+        except Exception as e:
+            self.record_failure(e)
+        else:
+            self.status['source_version'] = version
+            self.status['consecutive_failures'] = 0
+            self.status['healthy'] = True
+            if version is not None and version != self.synced_version:
+                self.sync(version)
+            else:
+                self.command.print_message("No new backup", verbosity_needed=2)
+        self.status['state'] = 'waiting'
+        self.write_status()
+        return self.get_delay()
+
+    def run(self, max_checks=None):
+        """ Poll until interrupted (or until max_checks checks have been made). """
+        self.command.print_message("Watching for new backups every %s seconds" % self.interval)
+        checks = 0
+        while max_checks is None or checks < max_checks:
+            delay = self.poll()
+            checks += 1
+            if max_checks is None or checks < max_checks:
+                self.sleep(delay)
@@ -42,13 +42,20 @@ setup(
     ],
 
     install_requires=install_requires,
+    extras_require={
+        "psycopg2": ["psycopg2"],
+    },
     tests_require=tests_require,
 
     packages=find_packages(exclude=["*test*"]),
 
     entry_points={
         "console_scripts": [
-            "paragres = paragres.cli:main"
+            "paragres = paragres.cli:main",
+            "paragres-server = paragres.server:main",
+        ],
+        "pytest11": [
+            "paragres = paragres.pytest_plugin",
         ],
     },
 )